@@ -7,15 +7,348 @@ import os
 import re
 import email
 from email import policy
-from collections import defaultdict
+from email.parser import BytesHeaderParser, BytesParser
+from collections import defaultdict, deque, Counter
 from pathlib import Path
+import argparse
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import threading
+import time
 import json
 import csv
 
+from classification_cache import ClassificationCache, message_signature
+from email_manifest import EmailManifest, file_digest
+from email_records import (BODY_VERSION, COMPREHENSIVE_CSV_COLUMNS, RecordStore, build_record,
+                           comprehensive_row, get_text_body)
+from mail_sources import Prefetcher, default_source, open_source
+from pipeline_metrics import Progress, RunRecord, StageMetrics, latency_bucket
+from results_db import ResultsDatabase
+from rule_engine import RuleEngine
+
+
+# Subject patterns that mark a bounce on their own
+BOUNCE_SUBJECT_PATTERNS = [
+    'mailer-daemon',
+    'delivery failure',
+    'delivery status notification',
+    'undeliverable',
+    'returned mail',
+    'mail delivery failed',
+    'bounce',
+    'message was not delivered',
+    "message couldn't be delivered",
+    "your message couldn't be delivered",
+    'undelivered mail',
+    'invalid email address',
+    'your email to',
+    'mail not delivered',
+    'message not delivered',
+    'failed',
+    'delivery notification',
+    'blocked sender',
+    'spam detection',
+    'incumplimiento de política',  # Spanish: policy violation
+    'no longer employed',
+    'is no longer with',
+    'deprecated domain',
+]
+
+# Bounce phrases looked for in the first 1000 characters of the body
+BOUNCE_BODY_PATTERNS = [
+    'hop count exceeded',
+    'user unknown',
+    'mailbox unavailable',
+    'recipient address rejected',
+    'delivery has failed',
+    'delivery has been delayed',
+    'permanently failed',
+    'recipient not found',
+]
+
+# Categorization rules in precedence order: the first category with a
+# matching alternative wins. Each alternative is a list of (field, patterns)
+# conditions that must all hold; a condition holds when any of the patterns
+# occurs in the field (see rule_engine.FIELD_SOURCES for the field names).
+CATEGORY_RULES = [
+    ('bounces', [
+        [('subject', BOUNCE_SUBJECT_PATTERNS)],
+        [('from', ['mailer-daemon', 'postmaster', 'no-reply', 'noreply']),
+         ('subject', ['delivery', 'failed', 'undeliv', 'bounce', 'message'])],
+        [('body_head', BOUNCE_BODY_PATTERNS)],
+    ]),
+    # Delivery delays (not failures)
+    ('delivery_delays', [
+        [('subject', ['delivery status notification (delay)'])],
+    ]),
+    ('out_of_office', [
+        [('subject', ['out of office', 'out of the office', 'ooo',
+                      'maternity leave', 'parental leave'])],
+        [('subject', ['automatic reply']),
+         ('body', ['vacation', 'away', 'office'])],
+        [('body_500', ['away from office', 'currently out of office',
+                       'will be out of the office'])],
+    ]),
+    ('automatic_replies', [
+        [('subject', ['automatic reply', 'autoresponse', 'auto-reply'])],
+        [('auto_submitted', ['auto-replied'])],
+        [('has_header', ['x-autoresponder'])],
+    ]),
+    ('contact_info', [
+        [('subject', ['new contact', 'updated contact', 'contact information',
+                      'email address change', 'new email address', 'contact details'])],
+    ]),
+    ('verification_requests', [
+        [('subject', ['verification', 'verify your email', 'confirm your email',
+                      'email verification', 'validate'])],
+    ]),
+    ('action_required', [
+        [('subject', ['action required', 'action needed', 'urgent'])],
+    ]),
+    ('unsubscribe', [
+        [('subject', ['unsubscribe'])],
+        [('subject', ['subscription']), ('body', ['remove'])],
+        [('subject', ['opt out', 'opt-out'])],
+    ]),
+    # Spam filters and security blocks
+    ('spam_filters', [
+        [('subject', ['spam detection', 'blocked sender', 'seg-az notification'])],
+        [('from', ['cold email shield', 'shield@mixmax', 'yooz@invitations',
+                   'proofpoint', 'trustwave'])],
+    ]),
+    ('security_alerts', [
+        [('subject', ['security alert', 'suspicious activity', 'login attempt'])],
+    ]),
+    # Replies (Re: in subject) - but not auto-replies
+    ('replies', [
+        [('subject_start', ['re:', 're ']),
+         ('not_auto_submitted', ['auto-replied'])],
+    ]),
+]
+
+
+def rules_version():
+    """Return a fingerprint of CATEGORY_RULES and BODY_VERSION (stored in the
+    incremental manifest and the classification cache)"""
+    return hashlib.sha1(json.dumps([CATEGORY_RULES, BODY_VERSION]).encode('utf-8')).hexdigest()
+
+
+# Analyzer used by each worker process in parallel mode (set by _init_worker)
+_worker_analyzer = None
+
+
+def _init_worker(emails_dir, options):
+    """Create the per-process analyzer used by _categorize_chunk
+    
+    ``options`` holds the analyzer attributes that affect per-file work
+    (see EmailAnalyzer._worker_options).
+    """
+    global _worker_analyzer
+    _worker_analyzer = EmailAnalyzer(emails_dir)
+    for name, value in options.items():
+        setattr(_worker_analyzer, name, value)
+    # New cache entries are sent back with each chunk (see _categorize_chunk)
+    _worker_analyzer._open_cache(track_new=True)
+
+
+def _categorize_chunk(idents):
+    """Parse and categorize a batch of email files inside a worker process
+    
+    Returns the (relative path, category, record, digest) results together
+    with the counters collected while processing the chunk and the entries
+    added to the classification cache.
+    """
+    _worker_analyzer.stats = Counter()
+    results = list(_worker_analyzer._categorize_serial(idents))
+    cache = _worker_analyzer.cache
+    return results, _worker_analyzer.stats, cache.drain_new() if cache is not None else []
+
+
+class LazyMessage:
+    """Email whose headers are parsed up front and whose body is parsed on demand
+    
+    Only the header block is parsed when the object is created. Single-part
+    messages keep their raw payload from that parse, so decoding the body
+    never needs a second pass; multipart (and message/*) emails are fully
+    MIME-parsed the first time the body or the whole message is requested.
+    """
+    
+    def __init__(self, raw):
+        self.raw = raw
+        self.headers = BytesHeaderParser(policy=policy.default).parsebytes(raw)
+        self._message = None
+        self._body = None
+        self._header_names = None
+    
+    def get(self, name, failobj=None):
+        """Return a header value, like email.message.Message.get"""
+        return self.headers.get(name, failobj)
+    
+    @property
+    def header_names(self):
+        """Lowercased names of all headers in the header block"""
+        if self._header_names is None:
+            self._header_names = frozenset(name.lower() for name in self.headers.keys())
+        return self._header_names
+    
+    def has_header(self, name):
+        """Return True if the header is present (e.g. X-Autoresponder, Precedence)"""
+        return name.lower() in self.header_names
+    
+    @property
+    def message(self):
+        """The fully parsed message"""
+        if self._message is None:
+            if self.headers.get_content_maintype() in ('multipart', 'message'):
+                self._message = BytesParser(policy=policy.default).parsebytes(self.raw)
+            else:
+                self._message = self.headers
+        return self._message
+    
+    @property
+    def body(self):
+        """Decoded first text/plain part of the message"""
+        if self._body is None:
+            self._body = get_text_body(self.message)
+        return self._body
+    
+    def __len__(self):
+        return len(self.headers)
+    
+    def __str__(self):
+        return str(self.message)
+
+
+class CategoryStream:
+    """Writes category rows as emails are classified
+    
+    Rows go to a CSV file (same columns as email_categories.csv) and a JSON
+    Lines file, in classification order. When ``details_file`` is given,
+    comprehensive detail rows are streamed there too. Only per-category
+    counts and the ``sample_size`` alphabetically first names per category
+    (what the text report lists) are kept in memory.
+    """
+    
+    def __init__(self, csv_file='email_categories.csv', jsonl_file='categories.jsonl',
+                 details_file=None, sample_size=100):
+        self.csv_file = csv_file
+        self.jsonl_file = jsonl_file
+        self.details_file = details_file
+        self.sample_size = sample_size
+        self.counts = Counter()
+        self.samples = defaultdict(list)
+        self._files = []
+    
+    def open(self, append=False):
+        """Open the output files and write the CSV headers
+        
+        With ``append``, rows are added to existing files (headers are only
+        written to files that are new or empty).
+        """
+        mode = 'a' if append else 'w'
+        csv_f = self._open(self.csv_file, mode)
+        self._jsonl = open(self.jsonl_file, mode, encoding='utf-8')
+        self._files = [csv_f, self._jsonl]
+        self._csv = csv.writer(csv_f)
+        if csv_f.tell() == 0:
+            self._csv.writerow(['Email Filename', 'Category', 'Category Name'])
+        self._details = None
+        if self.details_file:
+            details_f = self._open(self.details_file, mode)
+            self._files.append(details_f)
+            self._details = csv.writer(details_f)
+            if details_f.tell() == 0:
+                self._details.writerow(COMPREHENSIVE_CSV_COLUMNS)
+    
+    def _open(self, path, mode):
+        f = open(path, mode, newline='', encoding='utf-8')
+        f.seek(0, os.SEEK_END)
+        return f
+    
+    def add(self, rel_path, category, record=None):
+        """Write the rows for one classified email and update the counters"""
+        category_name = category.replace('_', ' ').title()
+        self._csv.writerow([rel_path, category, category_name])
+        self._jsonl.write(json.dumps({'path': rel_path, 'category': category}) + '\n')
+        if self._details is not None and record is not None:
+            self._details.writerow(comprehensive_row(rel_path, category, category_name, record))
+        
+        self.counts[category] += 1
+        sample = self.samples[category]
+        if len(sample) < self.sample_size or rel_path < sample[-1]:
+            bisect.insort(sample, rel_path)
+            if len(sample) > self.sample_size:
+                sample.pop()
+    
+    def flush(self):
+        """Push the rows written so far to disk, for readers of files still being written"""
+        for f in self._files:
+            f.flush()
+    
+    def close(self):
+        """Close the output files"""
+        for f in self._files:
+            f.close()
+        self._files = []
+        print(f"Categories CSV streamed to: {self.csv_file}")
+        print(f"Categories JSON Lines streamed to: {self.jsonl_file}")
+        if self.details_file:
+            print(f"✓ Comprehensive email details streamed to: {self.details_file}")
+
 
 class EmailAnalyzer:
-    def __init__(self, emails_dir):
-        self.emails_dir = Path(emails_dir)
+    def __init__(self, emails_dir, workers=1, chunk_size=500, record_store=None,
+                 manifest=None, stream=None, rule_stats=False, prefetch_threads=0,
+                 prefetch_bytes=64 * 1024 * 1024, walk_threads=0, estimate_total=False,
+                 results_db=None, cache_size=0, cache_file=None, consumer=None):
+        # Directory, .zip archive, mbox file or Maildir holding the emails;
+        # None when emails are only passed in memory (see email_classifier.py)
+        self.emails_dir = Path(emails_dir) if emails_dir is not None else None
+        self.source = open_source(emails_dir, walk_threads) if emails_dir is not None else None
+        # Count the emails in the background to show progress against a total
+        self.estimate_total = estimate_total
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        # Threads reading raw emails ahead of the parser, for slow or
+        # networked storage (0 reads each email when it is needed)
+        self.prefetch_threads = prefetch_threads
+        self.prefetch_bytes = prefetch_bytes
+        # Parsed records are written here during analyze_all so later stages
+        # don't have to re-read and re-parse the raw email files
+        self.record_store = RecordStore(record_store) if record_store else None
+        # Streaming mode: results are written as they are produced instead of
+        # being collected in self.categories (see CategoryStream)
+        self.stream = stream
+        # Optional SQLite results database that gets every categorized email
+        self.results_db = ResultsDatabase(results_db) if results_db else None
+        # Fused pipeline: every categorized email is also handed to this
+        # object (open/add/close, like CategoryStream) as soon as it is merged
+        self.consumer = consumer
+        self.build_records = (self.record_store is not None or self.results_db is not None or
+                              consumer is not None or
+                              (stream is not None and stream.details_file is not None))
+        # Incremental mode: files unchanged since the manifest was written
+        # keep their previous category and are not parsed again
+        self.manifest = None
+        if manifest:
+            self.manifest = EmailManifest(manifest, rules_version()).load()
+        self.hash_contents = self.manifest is not None
+        self.stats = Counter()
+        # Throughput, latency and error metrics of the last analyze_all run
+        # (per-email latencies are counted in self.stats by latency bucket)
+        self.metrics = None
+        # Rule instrumentation: per-rule counters and timings are added to
+        # self.stats (see RuleEngine.categorize) and saved by save_rule_stats
+        self.rule_stats = rule_stats
+        self.rule_engine = RuleEngine(CATEGORY_RULES)
+        # Classification cache: repeated and near-identical emails reuse the
+        # category of an earlier email with the same signature
+        self.cache_size = cache_size
+        self.cache_file = cache_file
+        self._open_cache()
         self.categories = {
             'bounces': [],
             'replies': [],
@@ -30,7 +363,14 @@ class EmailAnalyzer:
             'security_alerts': [],
             'other': []
         }
-        
+    
+    def _open_cache(self, track_new=False):
+        """Create the classification cache if one is configured"""
+        self.cache = None
+        if self.cache_size:
+            self.cache = ClassificationCache(self.cache_size, self.cache_file, rules_version(),
+                                             track_new=track_new).load()
+    
     def parse_email(self, filepath):
         """Parse an email file and return email object"""
         try:
@@ -41,209 +381,296 @@ class EmailAnalyzer:
             print(f"Error parsing {filepath}: {e}")
             return None
     
+    def read_ahead(self, idents):
+        """Yield (identifier, raw bytes or None) using the configured prefetcher"""
+        return Prefetcher(self.source, self.prefetch_threads, self.prefetch_bytes).read(idents)
+    
+    def load_email(self, ident, raw=None):
+        """Return an email as a LazyMessage, reading it from the source unless raw bytes are given"""
+        try:
+            if raw is None:
+                raw = self.source.read(ident)
+            return LazyMessage(raw)
+        except Exception as e:
+            print(f"Error parsing {ident}: {e}")
+            self.stats['parse_errors'] += 1
+            return None
+    
     def categorize_email(self, filepath, msg):
         """Categorize email based on headers and content"""
         if msg is None:
             return 'other'
         
-        filename = filepath.name
-        subject = msg.get('Subject', '').lower()
-        from_addr = msg.get('From', '').lower()
-        auto_submitted = msg.get('Auto-Submitted', '').lower()
-        x_auto_response = msg.get('X-Auto-Response-Suppress', '').lower()
+        fields = {
+            'subject': msg.get('Subject', '').lower(),
+            'from': msg.get('From', '').lower(),
+            'auto_submitted': msg.get('Auto-Submitted', '').lower(),
+        }
+        
+        def get_field(name):
+            # The body and header name index are only produced when a rule reads them
+            if name not in fields:
+                if name in ('body', 'body_head'):
+                    if isinstance(msg, LazyMessage):
+                        body = msg.body.lower()
+                    else:
+                        body = get_text_body(msg).lower()
+                    fields['body'] = body
+                    fields['body_head'] = body[:1000]
+                elif name == 'header_names':
+                    if isinstance(msg, LazyMessage):
+                        fields['header_names'] = msg.header_names
+                    else:
+                        fields['header_names'] = frozenset(key.lower() for key in msg.keys())
+            return fields[name]
         
-        # Get email body for content analysis
-        body = ''
-        try:
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == 'text/plain':
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore').lower()
-                        break
-            else:
-                body = msg.get_payload(decode=True).decode('utf-8', errors='ignore').lower()
-        except:
-            body = ''
-        
-        # Check for bounces (expanded patterns)
-        bounce_patterns_subject = [
-            'mailer-daemon',
-            'delivery failure',
-            'delivery status notification',
-            'undeliverable',
-            'returned mail',
-            'mail delivery failed',
-            'bounce',
-            'message was not delivered',
-            "message couldn't be delivered",
-            "your message couldn't be delivered",
-            'undelivered mail',
-            'invalid email address',
-            'your email to',
-            'mail not delivered',
-            'message not delivered',
-            'failed',
-            'delivery notification',
-            'blocked sender',
-            'spam detection',
-            'incumplimiento de política',  # Spanish: policy violation
-            'no longer employed',
-            'is no longer with',
-            'deprecated domain',
-        ]
-        
-        bounce_patterns_body = [
-            'hop count exceeded',
-            'user unknown',
-            'mailbox unavailable',
-            'recipient address rejected',
-            'delivery has failed',
-            'delivery has been delayed',
-            'permanently failed',
-            'recipient not found',
-        ]
-        
-        if (
-            any(pattern in subject for pattern in bounce_patterns_subject) or
-            any(pattern in from_addr for pattern in ['mailer-daemon', 'postmaster', 'no-reply', 'noreply']) and 
-            any(keyword in subject for keyword in ['delivery', 'failed', 'undeliv', 'bounce', 'message']) or
-            any(pattern in body[:1000] for pattern in bounce_patterns_body)
-        ):
-            return 'bounces'
-        
-        # Check for delivery delays (not failures)
-        if 'delivery status notification (delay)' in subject:
-            return 'delivery_delays'
-        
-        # Check for out of office
-        if (
-            'out of office' in subject or
-            'out of the office' in subject or
-            'ooo' in subject or
-            'maternity leave' in subject or
-            'parental leave' in subject or
-            ('automatic reply' in subject and ('vacation' in body or 'away' in body or 'office' in body)) or
-            'away from office' in body[:500] or
-            'currently out of office' in body[:500] or
-            'will be out of the office' in body[:500]
-        ):
-            return 'out_of_office'
-        
-        # Check for automatic replies
-        if (
-            'automatic reply' in subject or
-            'autoresponse' in subject or
-            'auto-reply' in subject or
-            auto_submitted == 'auto-replied' or
-            'x-autoresponder' in str(msg).lower()[:1000]
-        ):
-            return 'automatic_replies'
-        
-        # Check for contact info updates
-        if (
-            'new contact' in subject or
-            'updated contact' in subject or
-            'contact information' in subject or
-            'email address change' in subject or
-            'new email address' in subject or
-            'contact details' in subject
-        ):
-            return 'contact_info'
-        
-        # Check for verification/validation emails
-        if (
-            'verification' in subject or
-            'verify your email' in subject or
-            'confirm your email' in subject or
-            'email verification' in subject or
-            'validate' in subject
-        ):
-            return 'verification_requests'
-        
-        # Check for action required emails
-        if (
-            'action required' in subject or
-            'action needed' in subject or
-            'urgent' in subject
-        ):
-            return 'action_required'
-        
-        # Check for unsubscribe confirmations
-        if (
-            'unsubscribe' in subject or
-            'subscription' in subject and 'remove' in body or
-            'opt out' in subject or
-            'opt-out' in subject
-        ):
-            return 'unsubscribe'
-        
-        # Check for spam filters and security blocks
-        if (
-            'spam detection' in subject or
-            'blocked sender' in subject or
-            'cold email shield' in from_addr or
-            'shield@mixmax' in from_addr or
-            'yooz@invitations' in from_addr or
-            'proofpoint' in from_addr or
-            'seg-az notification' in subject or
-            'trustwave' in from_addr
-        ):
-            return 'spam_filters'
-        
-        # Check for security alerts
-        if (
-            'security alert' in subject or
-            'suspicious activity' in subject or
-            'login attempt' in subject
-        ):
-            return 'security_alerts'
-        
-        # Check for replies (Re: in subject) - but not auto-replies
-        if (subject.startswith('re:') or subject.startswith('re ')) and auto_submitted != 'auto-replied':
-            return 'replies'
-        
-        return 'other'
+        key = None
+        scans = {}
+        if self.cache is not None and isinstance(msg, LazyMessage):
+            key = message_signature(self.rule_engine.header_signature(get_field, scans), msg.raw)
+            category = self.cache.get(key)
+            if category is not None:
+                self.stats['cache_hits'] += 1
+                return category
+            self.stats['cache_misses'] += 1
+        
+        category = self.rule_engine.categorize(get_field, self.stats if self.rule_stats else None,
+                                               scans)
+        if 'body' not in fields:
+            self.stats['header_only'] += 1
+        if key is not None:
+            self.cache.put(key, category)
+        return category
     
     def analyze_all(self):
-        """Analyze all emails in the directory"""
-        # Find all .eml files recursively
-        email_files = list(self.emails_dir.rglob('*.eml'))
-        total = len(email_files)
+        """Analyze all emails in the mail source
+        
+        Emails are categorized as the source discovers them (.eml files are
+        found by walking the directory tree), so work starts right away
+        instead of after the whole source has been listed.
+        """
+        print(f"Analyzing emails in {self.source.location}...")
+        estimate = self._start_estimate() if self.estimate_total else None
+        self.metrics = StageMetrics('categorize')
+        progress = Progress('emails processed', every=1000)
         
-        print(f"Found {total} email files to analyze...")
+        if self.record_store:
+            self.record_store.open_for_writing(append=self.manifest is not None,
+                                               source=self.source.location)
+        if self.stream:
+            self.stream.open()
+        if self.results_db:
+            self.results_db.start_messages(self.source.location, list(self.categories))
+        if self.consumer:
+            self.consumer.open()
         
-        for idx, filepath in enumerate(email_files, 1):
-            if idx % 5000 == 0:
-                print(f"Progress: {idx}/{total} emails processed...")
+        # The categorizer reads ahead of this loop through its own copy of
+        # the planned emails; in incremental mode it only gets the new or
+        # changed ones
+        planned, lookahead = itertools.tee(self._plan(self.source.identifiers()))
+        pending = (rel_path for rel_path, category in lookahead if category is None)
+        if self.workers > 1:
+            results = self._categorize_parallel(pending)
+        else:
+            results = self._categorize_serial(pending)
+        
+        total = 0
+        reused = 0
+        for total, (rel_path, category) in enumerate(planned, 1):
+            progress.update(total, estimate[0] if estimate else None, approximate=True)
+            
+            if category is None:
+                rel_path, category, record, digest = next(results)
+                if record is not None and self.record_store:
+                    self.record_store.append(record)
+                if self.manifest is not None and digest is not None:
+                    self.manifest.update(rel_path, digest, category)
+            else:
+                reused += 1
+                record = None
+                if (self.stream and self.stream.details_file) or self.results_db or self.consumer:
+                    record = self.record_store.get(rel_path)
             
-            msg = self.parse_email(filepath)
-            category = self.categorize_email(filepath, msg)
-            # Store relative path from emails_dir
-            rel_path = filepath.relative_to(self.emails_dir)
-            self.categories[category].append(str(rel_path))
+            if self.results_db:
+                self.results_db.add_message(rel_path, category, record)
+            if self.stream:
+                self.stream.add(rel_path, category, record)
+            else:
+                self.categories[category].append(rel_path)
+            if self.consumer:
+                self.consumer.add(rel_path, category, record)
+        results.close()
+        if self.consumer:
+            self.consumer.close()
+        
+        if self.results_db:
+            self.results_db.close()
+            print(f"Results database saved to: {self.results_db.path}")
+        
+        if self.manifest is not None:
+            print(f"Unchanged since last run: {reused} emails; "
+                  f"analyzed {total - reused} new or changed emails")
+        if self.stream:
+            self.stream.close()
+        if self.record_store:
+            self.record_store.close()
+            print(f"Email records saved to: {self.record_store.path}")
+        if self.manifest is not None:
+            self.manifest.save()
+            if self.record_store:
+                self._compact_records()
+        if self.cache is not None:
+            self.cache.save()
+        
+        # Latencies are only counted for emails analyzed in this run
+        self.metrics.items = total
+        self.metrics.errors = self.stats['parse_errors']
+        self.metrics.categories.update(self.category_counts())
+        for key, count in self.stats.items():
+            if isinstance(key, tuple) and key[0] == 'latency':
+                self.metrics.latency[key[1]] += count
+        self.metrics.finish()
         
         print(f"\nAnalysis complete! Processed {total} emails.")
+        print(f"Decided on headers alone: {self.stats['header_only']} emails "
+              f"(body not decoded)")
+        if self.cache is not None:
+            print(f"Categorized from the classification cache: {self.stats['cache_hits']} emails "
+                  f"(rules not run, not counted above)")
         return self.categories
     
+    def _compact_records(self):
+        """Drop the stored records of changed and deleted emails once they pile up"""
+        dropped = self.record_store.compact(keep=self.manifest.current)
+        if dropped:
+            print(f"Email records compacted: dropped {dropped} records of changed or deleted emails")
+    
+    def _plan(self, email_files):
+        """Yield (identifier, category) for each email, where the category is
+        the one kept from the manifest or None if the email must be categorized"""
+        for rel_path in email_files:
+            category = None
+            if self.manifest is not None:
+                category = self.manifest.lookup(rel_path, self.source)
+                # Unchanged files still need a stored record for later steps
+                if category is not None and self.build_records and not (
+                        self.record_store and rel_path in self.record_store.index):
+                    category = None
+            yield rel_path, category
+    
+    def _start_estimate(self):
+        """Count the emails in a background thread, for progress messages
+        
+        Returns a list that holds the count once the walk has finished
+        (and is empty until then).
+        """
+        estimate = []
+        source = open_source(self.source.location)
+        
+        def count():
+            estimate.append(sum(1 for _ in source.identifiers()))
+        
+        threading.Thread(target=count, daemon=True).start()
+        return estimate
+    
+    def _worker_options(self):
+        """Analyzer attributes that worker processes need to copy"""
+        return {
+            'build_records': self.build_records,
+            'hash_contents': self.hash_contents,
+            'rule_stats': self.rule_stats,
+            'prefetch_threads': self.prefetch_threads,
+            'prefetch_bytes': self.prefetch_bytes,
+            'cache_size': self.cache_size,
+            'cache_file': self.cache_file,
+        }
+    
+    def _categorize_serial(self, email_files):
+        """Yield (identifier, category, record, digest) for each email in the current process
+        
+        The record is None unless records are being built for a record store,
+        and the content digest is None unless a manifest is being kept.
+        """
+        for rel_path, raw in self.read_ahead(email_files):
+            start = time.perf_counter()
+            msg = self.load_email(rel_path, raw)
+            category = self.categorize_email(rel_path, msg)
+            record = None
+            digest = None
+            if msg is not None:
+                if self.build_records:
+                    record = build_record(rel_path, msg, category, body=msg.body)
+                if self.hash_contents:
+                    digest = file_digest(msg.raw)
+            self.stats[('latency', latency_bucket(time.perf_counter() - start))] += 1
+            yield rel_path, category, record, digest
+    
+    def _categorize_parallel(self, email_files):
+        """Yield (identifier, category, record, digest) for each email using a process pool
+        
+        Chunks of ``chunk_size`` identifiers are taken from ``email_files`` as
+        they are discovered, keeping two chunks per worker in flight, and the
+        chunk results are consumed in submission order, so the merged
+        categories are identical to a serial run.
+        """
+        email_files = iter(email_files)
+        
+        print(f"Categorizing with {self.workers} worker processes "
+              f"(chunks of up to {self.chunk_size} files)...")
+        if self.cache is not None:
+            print("Note: each worker keeps its own classification cache, so near-identical "
+                  "emails can be categorized differently from run to run")
+        
+        with multiprocessing.Pool(self.workers,
+                                  initializer=_init_worker,
+                                  initargs=(self.source.location, self._worker_options())) as pool:
+            in_flight = deque()
+            while True:
+                while len(in_flight) < self.workers * 2:
+                    chunk = list(itertools.islice(email_files, self.chunk_size))
+                    if not chunk:
+                        break
+                    in_flight.append(pool.apply_async(_categorize_chunk, (chunk,)))
+                if not in_flight:
+                    return
+                chunk_results, chunk_stats, cache_entries = in_flight.popleft().get()
+                self.stats.update(chunk_stats)
+                for key, category in cache_entries:
+                    self.cache.put(key, category)
+                yield from chunk_results
+    
+    def category_counts(self):
+        """Return {category: number of emails}"""
+        if self.stream:
+            return {category: self.stream.counts[category] for category in self.categories}
+        return {category: len(emails) for category, emails in self.categories.items()}
+    
+    def category_sample(self, category, limit=100):
+        """Return the first ``limit`` email names of a category in sorted order"""
+        if self.stream:
+            return self.stream.samples[category][:limit]
+        return sorted(self.categories[category])[:limit]
+    
     def generate_report(self, output_file='analysis_report.txt'):
         """Generate a detailed report of the analysis"""
+        counts = self.category_counts()
+        
         with open(output_file, 'w') as f:
             f.write("=" * 80 + "\n")
             f.write("EMAIL ANALYSIS REPORT\n")
             f.write("=" * 80 + "\n\n")
             
-            total = sum(len(emails) for emails in self.categories.values())
+            total = sum(counts.values())
             f.write(f"Total emails analyzed: {total}\n\n")
             
             # Sort categories by count
-            sorted_categories = sorted(self.categories.items(), 
-                                     key=lambda x: len(x[1]), 
+            sorted_categories = sorted(counts.items(), 
+                                     key=lambda x: x[1], 
                                      reverse=True)
             
             f.write("SUMMARY BY CATEGORY:\n")
             f.write("-" * 80 + "\n")
-            for category, emails in sorted_categories:
-                count = len(emails)
+            for category, count in sorted_categories:
                 percentage = (count / total * 100) if total > 0 else 0
                 category_name = category.replace('_', ' ').title()
                 f.write(f"{category_name:30s}: {count:6d} ({percentage:5.2f}%)\n")
@@ -251,19 +678,33 @@ class EmailAnalyzer:
             f.write("\n" + "=" * 80 + "\n\n")
             
             # Detailed listings
-            for category, emails in sorted_categories:
-                if emails:
+            for category, count in sorted_categories:
+                if count:
                     category_name = category.replace('_', ' ').title()
-                    f.write(f"\n{category_name.upper()} ({len(emails)} emails)\n")
+                    f.write(f"\n{category_name.upper()} ({count} emails)\n")
                     f.write("-" * 80 + "\n")
-                    for email_name in sorted(emails)[:100]:  # Show first 100
+                    for email_name in self.category_sample(category, 100):  # Show first 100
                         f.write(f"  {email_name}\n")
-                    if len(emails) > 100:
-                        f.write(f"  ... and {len(emails) - 100} more\n")
+                    if count > 100:
+                        f.write(f"  ... and {count - 100} more\n")
                     f.write("\n")
         
         print(f"\nDetailed report saved to: {output_file}")
     
+    def save_rule_stats(self, output_file='rule_stats.json'):
+        """Save the per-rule hit counts and timings collected with rule_stats=True
+        
+        Emails categorized from the classification cache never reach the
+        rules; they are counted separately as 'cache_hits', and 'messages'
+        only counts the emails the rules were run on.
+        """
+        report = self.rule_engine.rule_report(self.stats)
+        report['cache_hits'] = self.stats['cache_hits']
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        
+        print(f"Rule statistics saved to: {output_file}")
+    
     def save_categories_json(self, output_file='categories.json'):
         """Save categories to JSON file"""
         with open(output_file, 'w') as f:
@@ -290,74 +731,56 @@ class EmailAnalyzer:
         
         with open(output_file, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
-            writer.writerow([
-                'Email Filename',
-                'Category',
-                'Category Name',
-                'From',
-                'To',
-                'Subject',
-                'Date',
-                'Body Preview'
-            ])
+            writer.writerow(COMPREHENSIVE_CSV_COLUMNS)
             
             total_emails = sum(len(emails) for emails in self.categories.values())
             processed = 0
             
+            # Read details from the record store written by analyze_all when
+            # there is one, instead of re-parsing every email file
+            records = self.record_store
+            if records is not None and records.exists():
+                records.load()
+            else:
+                records = None
+            
             # Process all emails with their categories
             for category, email_files in sorted(self.categories.items()):
                 category_name = category.replace('_', ' ').title()
                 
-                for email_file in sorted(email_files):
+                email_files = sorted(email_files)
+                if records is not None:
+                    emails = ((email_file, None) for email_file in email_files)
+                else:
+                    # Raw emails are read ahead while earlier ones are parsed
+                    emails = self.read_ahead(email_files)
+                
+                for email_file, raw in emails:
                     processed += 1
                     if processed % 5000 == 0:
                         print(f"Progress: {processed}/{total_emails} emails processed...")
                     
-                    filepath = self.emails_dir / email_file
-                    if not filepath.exists():
-                        continue
+                    if records is not None:
+                        record = records.get(email_file)
+                    else:
+                        # Parse email to get full details
+                        msg = self.load_email(email_file, raw)
+                        if msg is None:
+                            continue
+                        record = build_record(email_file, msg, category, body=msg.body)
                     
-                    # Parse email to get full details
-                    msg = self.parse_email(filepath)
-                    if msg:
-                        from_addr = msg.get('From', '')
-                        to_addr = msg.get('To', '')
-                        subject = msg.get('Subject', '')
-                        date = msg.get('Date', '')
-                        
-                        # Get email body (first 500 chars for preview)
-                        body = ''
-                        try:
-                            if msg.is_multipart():
-                                for part in msg.walk():
-                                    if part.get_content_type() == 'text/plain':
-                                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                                        break
-                            else:
-                                body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        except:
-                            body = ''
-                        
-                        # Clean and limit body for CSV
-                        if body:
-                            body = body[:500].replace('\n', ' ').replace('\r', ' ').strip()
-                        
-                        writer.writerow([
-                            email_file,
-                            category,
-                            category_name,
-                            from_addr,
-                            to_addr,
-                            subject,
-                            date,
-                            body
-                        ])
+                    if record:
+                        writer.writerow(comprehensive_row(email_file, category, category_name, record))
+            
+            if records is not None:
+                records.close()
         
         print(f"✓ Comprehensive email details saved to: {output_file}")
     
     def print_summary(self):
         """Print a summary of the analysis"""
-        total = sum(len(emails) for emails in self.categories.values())
+        counts = self.category_counts()
+        total = sum(counts.values())
         
         print("\n" + "=" * 80)
         print("ANALYSIS SUMMARY")
@@ -365,22 +788,84 @@ class EmailAnalyzer:
         print(f"\nTotal emails analyzed: {total}\n")
         
         # Sort categories by count
-        sorted_categories = sorted(self.categories.items(), 
-                                 key=lambda x: len(x[1]), 
+        sorted_categories = sorted(counts.items(), 
+                                 key=lambda x: x[1], 
                                  reverse=True)
         
-        for category, emails in sorted_categories:
-            count = len(emails)
+        for category, count in sorted_categories:
             percentage = (count / total * 100) if total > 0 else 0
             category_name = category.replace('_', ' ').title()
             print(f"{category_name:30s}: {count:6d} ({percentage:5.2f}%)")
         
+        if self.cache is not None:
+            lookups = self.stats['cache_hits'] + self.stats['cache_misses']
+            hit_rate = (self.stats['cache_hits'] / lookups * 100) if lookups > 0 else 0
+            print(f"\nClassification cache hits: {self.stats['cache_hits']}/{lookups} "
+                  f"({hit_rate:.2f}%)")
+        
         print("=" * 80)
 
 
-def main():
-    # Path to the emails directory
-    emails_dir = './relpies1114'
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Categorize emails in the relpies1114 directory')
+    parser.add_argument('--source',
+                        help='emails to analyze: a directory of .eml files, a .zip archive, '
+                             'an mbox file or a Maildir (default: ./relpies1114, or '
+                             './relpies1114.zip if the directory does not exist)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes used for categorization (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help='number of files sent to a worker at a time (default: 500)')
+    parser.add_argument('--records', default='email_records.jsonl',
+                        help='parsed email record store shared with later steps '
+                             '(default: email_records.jsonl)')
+    parser.add_argument('--no-records', action='store_true',
+                        help='do not write the email record store (an existing one is removed, '
+                             'since it would not match the new categories)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only analyze emails that are new or changed since the last '
+                             'incremental run (tracked in the manifest file)')
+    parser.add_argument('--manifest', default='email_manifest.json',
+                        help='manifest file used by --incremental (default: email_manifest.json)')
+    parser.add_argument('--stream', action='store_true',
+                        help='write email_categories.csv, categories.jsonl and '
+                             'comprehensive_email_details.csv while emails are classified, '
+                             'keeping only counters in memory (rows are in discovery order)')
+    parser.add_argument('--rule-stats', action='store_true',
+                        help='record per-rule hit counts and timings in rule_stats.json')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='threads reading emails ahead of the parser, for slow or '
+                             'network-mounted storage (default: 0, no read-ahead)')
+    parser.add_argument('--prefetch-mb', type=int, default=64,
+                        help='maximum read-ahead data held in memory per process in MB (default: 64)')
+    parser.add_argument('--walk-threads', type=int, default=0,
+                        help='threads listing subdirectories ahead of the directory walk '
+                             '(default: 0)')
+    parser.add_argument('--db',
+                        help='also write the categorized emails to this SQLite results database')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='reuse categories of repeated and near-identical emails, keeping up '
+                             'to this many signatures (default: 0, no cache; with --workers each '
+                             'worker has its own cache, so results can vary between runs)')
+    parser.add_argument('--cache-file',
+                        help='keep the classification cache in this file across runs')
+    parser.add_argument('--estimate-total', action='store_true',
+                        help='count the emails in the background to show progress against a total')
+    parser.add_argument('--metrics',
+                        help='add throughput, latency, error, memory and per-category metrics '
+                             'of this run to a JSON run record (e.g. metrics.json)')
+    parser.add_argument('--metrics-prom',
+                        help='with --metrics, also write the metrics in Prometheus text format '
+                             '(e.g. for the node_exporter textfile collector)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None, consumer=None):
+    args = parse_args(argv)
+    
+    # Path to the emails: a directory, .zip archive, mbox file or Maildir
+    emails_dir = args.source or default_source('./relpies1114')
     
     if not os.path.exists(emails_dir):
         print(f"Error: Directory '{emails_dir}' not found!")
@@ -388,7 +873,23 @@ def main():
         return
     
     # Create analyzer
-    analyzer = EmailAnalyzer(emails_dir)
+    record_store = None if args.no_records else args.records
+    if args.no_records and RecordStore(args.records).exists():
+        # Records of an earlier run would no longer match the categories
+        RecordStore(args.records).remove()
+        print(f"Removed {args.records}, written by an earlier run")
+    manifest = args.manifest if args.incremental else None
+    stream = None
+    if args.stream:
+        stream = CategoryStream('email_categories.csv', 'categories.jsonl',
+                                details_file='comprehensive_email_details.csv')
+    analyzer = EmailAnalyzer(emails_dir, workers=args.workers, chunk_size=args.chunk_size,
+                             record_store=record_store, manifest=manifest, stream=stream,
+                             rule_stats=args.rule_stats, prefetch_threads=args.prefetch,
+                             prefetch_bytes=args.prefetch_mb * 1024 * 1024,
+                             walk_threads=args.walk_threads, estimate_total=args.estimate_total,
+                             results_db=args.db, cache_size=args.cache_size,
+                             cache_file=args.cache_file, consumer=consumer)
     
     # Analyze all emails
     print("Starting email analysis...")
@@ -400,6 +901,23 @@ def main():
     # Generate detailed report
     analyzer.generate_report('analysis_report.txt')
     
+    if args.rule_stats:
+        analyzer.save_rule_stats('rule_stats.json')
+    
+    if args.metrics:
+        RunRecord(args.metrics, args.metrics_prom).load().add_stage(analyzer.metrics).save()
+    
+    if stream:
+        print("\n✓ Analysis complete!")
+        print("  - Summary displayed above")
+        print("  - Detailed report: analysis_report.txt")
+        print("  - JSON Lines data: categories.jsonl")
+        print("  - CSV data: email_categories.csv")
+        print("  - Comprehensive details: comprehensive_email_details.csv (includes To, Body)")
+        if record_store:
+            print(f"  - Parsed email records: {record_store} (reused by extract_contact_info.py)")
+        return
+    
     # Save categories to JSON
     analyzer.save_categories_json('categories.json')
     
@@ -415,6 +933,8 @@ def main():
     print("  - JSON data: categories.json")
     print("  - CSV data: email_categories.csv")
     print("  - Comprehensive details: comprehensive_email_details.csv (includes To, Body)")
+    if record_store:
+        print(f"  - Parsed email records: {record_store} (reused by extract_contact_info.py)")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Builds synthetic email corpora and times each pipeline stage
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from pipeline_metrics import peak_rss_mb
+
+
+# Relative weights of the kinds of message in each corpus mix
+MIXES = {
+    'default': {
+        'reply': 30, 'out_of_office': 15, 'automatic_reply': 10, 'dsn_bounce': 15,
+        'html': 15, 'attachment': 5, 'other': 10,
+    },
+    'bounces': {'dsn_bounce': 70, 'reply': 10, 'other': 20},
+    'multipart': {'html': 50, 'attachment': 30, 'reply': 20},
+    'attachments': {'attachment': 60, 'reply': 20, 'out_of_office': 20},
+}
+
+# Stages in pipeline order; each one reads the outputs of the one before
+STAGES = ['analyze', 'extract', 'enrich']
+
+# Categories the contact extraction step works on (as in extract_contact_info.py)
+TARGET_CATEGORIES = ['replies', 'out_of_office', 'automatic_replies', 'contact_info']
+
+FIRST_NAMES = ['John', 'Mary', 'Anna', 'David', 'Priya', 'Luis', 'Chen', 'Fatima', 'Tom', 'Olga']
+LAST_NAMES = ['Smith', 'Jones', 'Garcia', 'Patel', 'Kim', 'Novak', 'Brown', 'Rossi', 'Silva', 'Khan']
+DOMAINS = ['acme.com', 'globex.io', 'initech.net', 'umbrella.co', 'gmail.com', 'outlook.com']
+TITLES = ['VP of Sales', 'Director of Engineering', 'Head of Marketing', 'Operations Manager', 'CEO']
+COMPANIES = ['Acme Corp Inc', 'Globex LLC', 'Initech Ltd', 'Umbrella Group']
+
+FILLER = ('Thanks for the note about the proposal. We are reviewing the numbers with the team '
+          'and will come back to you once the budget for next quarter is settled. ')
+
+
+def _person(rng):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    return first, last, f"{first.lower()}.{last.lower()}@{rng.choice(DOMAINS)}"
+
+
+def _phone(rng):
+    return f"({rng.randint(200, 989)}) {rng.randint(200, 989)}-{rng.randint(1000, 9999)}"
+
+
+def _headers(rng, index, subject, sender, content_type, extra=''):
+    return (f"From: {sender}\n"
+            f"To: rep@oursales.com\n"
+            f"Subject: {subject}\n"
+            f"Date: Mon, {1 + index % 28:02d} Jan 2024 {index % 24:02d}:{index % 60:02d}:00 +0000\n"
+            f"Message-ID: <bench.{index}@example.com>\n"
+            f"MIME-Version: 1.0\n"
+            f"{extra}"
+            f"Content-Type: {content_type}\n")
+
+
+def _signature(rng, first, last, email):
+    return (f"\n\n{first} {last}\n{rng.choice(TITLES)}\nat {rng.choice(COMPANIES)}\n"
+            f"Tel: {_phone(rng)}\n{email}\n")
+
+
+def _reply(rng, index, blob):
+    first, last, email = _person(rng)
+    body = (f"Hi,\n\nSure, happy to talk next week.\n\n{FILLER * rng.randint(1, 4)}"
+            f"{_signature(rng, first, last, email)}"
+            f"\nOn Mon, Jan 1, 2024 at 10:00 AM Sales Rep <rep@oursales.com> wrote:\n"
+            f"> Do you have time for a quick call?\n")
+    return _headers(rng, index, 'Re: Quick question', f'"{first} {last}" <{email}>',
+                    'text/plain; charset="utf-8"') + '\n' + body
+
+
+def _out_of_office(rng, index, blob):
+    first, last, email = _person(rng)
+    _, _, backup = _person(rng)
+    body = (f"I am currently out of the office until Monday with limited access to email.\n"
+            f"For urgent matters please contact {backup} or call {_phone(rng)}."
+            f"{_signature(rng, first, last, email)}")
+    return _headers(rng, index, f'Out of Office: {first} {last}', f'{first} {last} <{email}>',
+                    'text/plain; charset="utf-8"', 'Auto-Submitted: auto-replied\n') + '\n' + body
+
+
+def _automatic_reply(rng, index, blob):
+    first, last, email = _person(rng)
+    body = "Thank you for your message. This is an automated response; we will reply shortly.\n"
+    return _headers(rng, index, 'Automatic reply: Quick question', f'{first} {last} <{email}>',
+                    'text/plain; charset="utf-8"',
+                    'Auto-Submitted: auto-replied\nX-Autoresponder: yes\n') + '\n' + body
+
+
+def _dsn_bounce(rng, index, blob):
+    _, _, email = _person(rng)
+    boundary = f"dsn{index}"
+    return (_headers(rng, index, 'Undelivered Mail Returned to Sender',
+                     'MAILER-DAEMON@mx.example.net',
+                     f'multipart/report; report-type=delivery-status; boundary="{boundary}"',
+                     'Auto-Submitted: auto-replied\n')
+            + f"\n--{boundary}\n"
+              f"Content-Type: text/plain; charset=us-ascii\n\n"
+              f"This is the mail system. Your message could not be delivered to one or more "
+              f"recipients.\n\n<{email}>: host mx.example.net said: 550 5.1.1 user unknown\n"
+              f"\n--{boundary}\n"
+              f"Content-Type: message/delivery-status\n\n"
+              f"Reporting-MTA: dns; mx.example.net\n\n"
+              f"Final-Recipient: rfc822; {email}\nAction: failed\nStatus: 5.1.1\n"
+              f"Diagnostic-Code: smtp; 550 5.1.1 user unknown\n"
+              f"\n--{boundary}\n"
+              f"Content-Type: message/rfc822\n\n"
+              f"From: rep@oursales.com\nTo: {email}\nSubject: Quick question\n\n"
+              f"Do you have time for a quick call?\n"
+              f"\n--{boundary}--\n")
+
+
+def _html(rng, index, blob):
+    first, last, email = _person(rng)
+    boundary = f"alt{index}"
+    text = f"Thanks, let us set up a call.\n{FILLER * rng.randint(1, 6)}{_signature(rng, first, last, email)}"
+    html = ('<html><head><style>p { margin: 0 }</style></head><body>'
+            + ''.join(f'<p>{line}</p>' for line in text.split('\n'))
+            + '<img src="https://t.example.com/open.gif" width="1" height="1"></body></html>')
+    return (_headers(rng, index, 'Re: Proposal', f'"{first} {last}" <{email}>',
+                     f'multipart/alternative; boundary="{boundary}"')
+            + f"\n--{boundary}\nContent-Type: text/plain; charset=utf-8\n\n{text}\n"
+              f"--{boundary}\nContent-Type: text/html; charset=utf-8\n\n{html}\n"
+              f"--{boundary}--\n")
+
+
+def _attachment(rng, index, blob):
+    first, last, email = _person(rng)
+    boundary = f"mix{index}"
+    # A slice of the shared base64 blob, starting on a line boundary
+    start = rng.randrange(0, max(1, len(blob) // 2)) // 77 * 77
+    return (_headers(rng, index, 'Re: Contract draft', f'{first} {last} <{email}>',
+                     f'multipart/mixed; boundary="{boundary}"')
+            + f"\n--{boundary}\nContent-Type: text/plain; charset=utf-8\n\n"
+              f"Please find the signed contract attached.{_signature(rng, first, last, email)}\n"
+              f"--{boundary}\nContent-Type: application/pdf; name=\"contract.pdf\"\n"
+              f"Content-Disposition: attachment; filename=\"contract.pdf\"\n"
+              f"Content-Transfer-Encoding: base64\n\n{blob[start:start + len(blob) // 2]}"
+              f"--{boundary}--\n")
+
+
+def _other(rng, index, blob):
+    first, last, email = _person(rng)
+    subject = rng.choice(['Newsletter', 'Invoice available', 'Meeting notes', 'Hello'])
+    return _headers(rng, index, subject, f'{first} {last} <{email}>',
+                    'text/plain; charset="utf-8"') + '\n' + FILLER * rng.randint(1, 3)
+
+
+BUILDERS = {
+    'reply': _reply,
+    'out_of_office': _out_of_office,
+    'automatic_reply': _automatic_reply,
+    'dsn_bounce': _dsn_bounce,
+    'html': _html,
+    'attachment': _attachment,
+    'other': _other,
+}
+
+
+def generate_corpus(output_dir, size, mix='default', seed=0, attachment_kb=256):
+    """Write a reproducible synthetic corpus of .eml files
+    
+    The same size, mix, seed and attachment size always produce the same
+    files. Messages are spread over subdirectories of 1000 files. A
+    corpus.json description is written last, and an existing corpus with
+    the same description is reused.
+    """
+    output_dir = Path(output_dir)
+    description = {'size': size, 'mix': mix, 'seed': seed, 'attachment_kb': attachment_kb}
+    marker = output_dir / 'corpus.json'
+    if marker.exists():
+        with open(marker, 'r') as f:
+            if json.load(f) == description:
+                print(f"Reusing corpus in {output_dir}")
+                return output_dir
+    
+    rng = random.Random(seed)
+    # Random attachment data is encoded once and sliced per message
+    raw = rng.getrandbits(8 * attachment_kb * 1024 * 2).to_bytes(attachment_kb * 1024 * 2, 'little')
+    blob = base64.encodebytes(raw).decode('ascii')
+    
+    kinds = sorted(MIXES[mix])
+    weights = [MIXES[mix][kind] for kind in kinds]
+    
+    print(f"Generating {size} emails ({mix} mix) in {output_dir}...")
+    for index in range(size):
+        kind = rng.choices(kinds, weights)[0]
+        folder = output_dir / f"{index // 1000:04d}"
+        if index % 1000 == 0:
+            folder.mkdir(parents=True, exist_ok=True)
+        with open(folder / f"msg{index:07d}.eml", 'w', encoding='utf-8') as f:
+            f.write(BUILDERS[kind](rng, index, blob))
+        if (index + 1) % 10000 == 0:
+            print(f"Progress: {index + 1}/{size} emails generated...")
+    
+    with open(marker, 'w') as f:
+        json.dump(description, f)
+    return output_dir
+
+
+def run_stage(stage, corpus_dir, workers=1):
+    """Run one stage in the current directory and return its measurements
+    
+    Only the stage method itself is timed; loading inputs and saving the
+    outputs the next stage reads are not.
+    """
+    from analyze_emails import EmailAnalyzer
+    from extract_contact_info import ContactInfoExtractor
+    from enrich_contacts import ContactEnricher
+    
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if stage == 'analyze':
+            analyzer = EmailAnalyzer(corpus_dir, workers=workers, record_store='email_records.jsonl')
+            start = time.perf_counter()
+            analyzer.analyze_all()
+            wall = time.perf_counter() - start
+            analyzer.save_categories_json('categories.json')
+            messages = sum(analyzer.category_counts().values())
+        elif stage == 'extract':
+            extractor = ContactInfoExtractor(corpus_dir, 'categories.json',
+                                             records_file='email_records.jsonl')
+            start = time.perf_counter()
+            extractor.extract_from_categories(TARGET_CATEGORIES)
+            wall = time.perf_counter() - start
+            extractor.save_to_json('extracted_contacts.json')
+            messages = sum(len(extractor.categories.get(c, [])) for c in TARGET_CATEGORIES)
+        elif stage == 'enrich':
+            enricher = ContactEnricher('extracted_contacts.json')
+            start = time.perf_counter()
+            enricher.enrich_all_contacts()
+            wall = time.perf_counter() - start
+            messages = len(enricher.contacts)
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+    
+    own, children = peak_rss_mb()
+    return {
+        'stage': stage,
+        'messages': messages,
+        'wall_seconds': round(wall, 3),
+        'messages_per_sec': round(messages / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': own,
+        'peak_rss_children_mb': children,
+    }
+
+
+def benchmark_size(size, args):
+    """Generate (or reuse) a corpus and run every stage on it in its own process"""
+    corpus_dir = Path(args.corpus_dir) / f"{args.mix}-{size}-seed{args.seed}"
+    generate_corpus(corpus_dir, size, args.mix, args.seed, args.attachment_kb)
+    corpus_bytes = sum(f.stat().st_size for f in corpus_dir.rglob('*.eml'))
+    
+    # Stage outputs go to a scratch directory next to the corpus
+    work_dir = Path(args.corpus_dir) / f"work-{args.mix}-{size}-seed{args.seed}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    
+    stages = {}
+    for stage in args.stages:
+        print(f"Running {stage} on {size} emails...")
+        # A fresh process per stage, so peak RSS belongs to that stage alone
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-stage', stage,
+             '--workers', str(args.workers), str(corpus_dir.resolve())],
+            cwd=str(work_dir), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        stages[stage] = result
+        print(f"  {stage:8s}: {result['wall_seconds']:9.3f}s  "
+              f"{result['messages_per_sec'] or 0:10.1f} msgs/sec  "
+              f"peak RSS {result['peak_rss_mb']} MB")
+    
+    return {'size': size, 'corpus_bytes': corpus_bytes, 'stages': stages}
+
+
+def _long_body(rng, kb):
+    """Return a reply of about ``kb`` KB with a long quoted thread of tables, numbers and addresses"""
+    first, last, email = _person(rng)
+    parts = [f"Hi,\n\nThe figures are below.{_signature(rng, first, last, email)}"]
+    size = len(parts[0])
+    while size < kb * 1024:
+        _, _, quoted = _person(rng)
+        block = (f"\nOn Mon, Jan {rng.randint(1, 28)}, 2024 at 10:00 AM {quoted} wrote:\n"
+                 + ''.join(f"> {FILLER}\n" for _ in range(rng.randint(1, 6))))
+        if rng.random() < 0.3:
+            block += "> Order      Qty      Price        Total\n" + ''.join(
+                f"> {rng.randint(10000, 99999)}      {rng.randint(1, 99):3d}      "
+                f"{rng.randint(1, 999)}.{rng.randint(0, 99):02d}      "
+                f"{rng.randint(1000, 99999)}.{rng.randint(0, 99):02d}\n"
+                for _ in range(rng.randint(3, 8)))
+        block += (f"> Call me at {_phone(rng)} or +44 20 {rng.randint(1000, 9999)} "
+                  f"{rng.randint(1000, 9999)}.\n>{' ' * rng.randint(20, 80)}\n")
+        parts.append(block)
+        size += len(block)
+    return ''.join(parts)
+
+
+def _reference_scan(text):
+    """Contact scanning as done before ContactScanner: every pattern over the whole body"""
+    phones = []
+    for pattern in [r'\+?1?\s*\(?(\d{3})\)?[\s.-]?(\d{3})[\s.-]?(\d{4})',
+                    r'\+\d{1,3}\s*\d{1,14}', r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}']:
+        for match in re.findall(pattern, text):
+            phone = re.sub(r'[^\d+]', '', ''.join(match) if isinstance(match, tuple) else match)
+            if len(phone) >= 10:
+                phones.append(phone)
+    system_emails = ['noreply', 'no-reply', 'mailer-daemon', 'postmaster',
+                     'donotreply', 'do-not-reply', 'bounce', 'notification']
+    emails = [e.lower() for e in re.findall(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', text)
+              if not any(sys in e.lower() for sys in system_emails)]
+    found = {'phones': list(set(phones)), 'emails': list(set(emails))}
+    for line in text.split('\n')[:15]:
+        line = line.strip()
+        if not line or len(line) > 100:
+            continue
+        if re.search(r'\b(CEO|CTO|CFO|COO|CMO|VP|Director|Manager|Lead|Head|Chief|President|Senior|'
+                     r'Junior|Specialist|Engineer|Developer|Analyst|Coordinator|Administrator)\b',
+                     line, re.IGNORECASE):
+            found['title'] = line
+        company_match = re.search(r'(?:at|@)\s+([A-Z][A-Za-z0-9\s&.,]+(?:Inc|LLC|Ltd|Corp|Co|Company)?)', line)
+        if company_match:
+            found['company'] = company_match.group(1).strip()
+    return found
+
+
+def benchmark_scanner(body_kb, seed=0, bodies=20):
+    """Time ContactScanner against the previous whole-body scanning on long bodies
+    
+    Both must find the same phones, emails, title and company in every body.
+    """
+    from contact_scanner import ContactScanner
+    
+    scanner = ContactScanner()
+    rng = random.Random(seed)
+    texts = [_long_body(rng, body_kb) for _ in range(bodies)]
+    
+    def normalized(found):
+        return {key: sorted(value) if isinstance(value, list) else value for key, value in found.items()}
+    
+    timings = {}
+    results = {}
+    for name, scan in (('reference', _reference_scan), ('scanner', scanner.scan)):
+        start = time.perf_counter()
+        results[name] = [scan(text) for text in texts]
+        timings[name] = time.perf_counter() - start
+    if list(map(normalized, results['reference'])) != list(map(normalized, results['scanner'])):
+        raise AssertionError(f"ContactScanner results differ from the reference on {body_kb} KB bodies")
+    
+    return {
+        'body_kb': body_kb,
+        'bodies': bodies,
+        'reference_ms_per_body': round(timings['reference'] / bodies * 1000, 3),
+        'scanner_ms_per_body': round(timings['scanner'] / bodies * 1000, 3),
+        'speedup': round(timings['reference'] / timings['scanner'], 2) if timings['scanner'] > 0 else None,
+    }
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Benchmark the email analysis pipeline '
+                                                 'on synthetic corpora')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='corpus sizes to benchmark, e.g. 10000 100000 1000000 (default: 10000)')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default',
+                        help='kinds of message in the corpus (default: default)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed; the same seed gives the same corpus (default: 0)')
+    parser.add_argument('--attachment-kb', type=int, default=256,
+                        help='approximate size of generated attachments in KB (default: 256)')
+    parser.add_argument('--corpus-dir', default='benchmark_corpora',
+                        help='where corpora and stage outputs are kept (default: benchmark_corpora)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes used by the analyze stage (default: 1)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='stages to run, in pipeline order (default: all)')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='machine-readable results file (default: benchmark_results.json)')
+    parser.add_argument('--scanner-kb', type=int, nargs='+',
+                        help='instead of the pipeline stages, time contact scanning on bodies of '
+                             'these sizes in KB, e.g. 4 64 512')
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('corpus', nargs='?', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    if args.run_stage:
+        # Child process started by benchmark_size(): report on stdout as JSON
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        print(json.dumps(run_stage(args.run_stage, args.corpus, args.workers)))
+        return
+    
+    if args.scanner_kb:
+        results = {'python': platform.python_version(), 'seed': args.seed, 'scanner': []}
+        for kb in args.scanner_kb:
+            result = benchmark_scanner(kb, args.seed)
+            results['scanner'].append(result)
+            print(f"  {kb:6d} KB bodies: {result['reference_ms_per_body']:10.3f} ms before, "
+                  f"{result['scanner_ms_per_body']:10.3f} ms with ContactScanner "
+                  f"({result['speedup']}x)")
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBenchmark results saved to: {args.output}")
+        return
+    
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mix': args.mix,
+        'seed': args.seed,
+        'attachment_kb': args.attachment_kb,
+        'workers': args.workers,
+        'runs': [benchmark_size(size, args) for size in args.sizes],
+    }
+    
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nBenchmark results saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Classification Cache - Reuses categories of repeated and near-identical emails
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from pathlib import Path
+
+
+# Raw body bytes that go into a signature, after normalization
+BODY_PREFIX_BYTES = 2048
+
+# MIME boundaries are random per message, so they are left out of the body
+# prefix (read from the raw header block, which is cheaper than parsing
+# the Content-Type header)
+BOUNDARY_PARAM = re.compile(rb'boundary\s*=\s*"?([^";\r\n]+)', re.IGNORECASE)
+
+# Email addresses and numbers (dates, times, ids, counts) are replaced in the
+# body prefix, so bounces and auto-replies generated from the same template
+# share a signature
+VARIABLE_TOKENS = re.compile(rb'[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\d+')
+
+
+def message_signature(header_signature, raw):
+    """Return the cache key of an email
+    
+    ``header_signature`` summarizes what the rules see in the headers (see
+    RuleEngine.header_signature). The body is represented by its first
+    BODY_PREFIX_BYTES raw bytes with the MIME boundary, addresses and
+    numbers removed, plus the magnitude of the message size.
+    """
+    header_end = raw.find(b'\n\n')
+    crlf_end = raw.find(b'\r\n\r\n')
+    if crlf_end != -1 and (header_end == -1 or crlf_end < header_end):
+        header_end = crlf_end
+    if header_end == -1:
+        header_end = len(raw)
+    body = raw[header_end:header_end + BODY_PREFIX_BYTES]
+    boundary = BOUNDARY_PARAM.search(raw, 0, header_end)
+    if boundary:
+        body = body.replace(boundary.group(1), b'')
+    body = VARIABLE_TOKENS.sub(b'#', body)
+    
+    digest = hashlib.sha1(repr(header_signature).encode('utf-8'))
+    digest.update(b'\0%d\0' % len(raw).bit_length())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class ClassificationCache:
+    """Bounded LRU map from message signature to category
+    
+    Opt-in: a signature only looks at the start of the body, so two emails
+    whose bodies differ only further down (where a body rule might match)
+    share a category. With ``path`` the entries are loaded from and saved
+    to a JSON file; a file written for different categorization rules
+    (``rules_version``) is ignored.
+    """
+    
+    def __init__(self, max_size=100000, path=None, rules_version=None, track_new=False):
+        self.max_size = max_size
+        self.path = Path(path) if path else None
+        self.rules_version = rules_version
+        self.entries = OrderedDict()
+        # With track_new, entries added since the last drain_new() are kept
+        # so worker processes can send them back to the main process
+        self.track_new = track_new
+        self.new_entries = []
+    
+    def load(self):
+        """Load the persisted entries if there is a usable cache file"""
+        if self.path is None or not self.path.exists():
+            return self
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('rules_version') == self.rules_version:
+            for key, category in data.get('entries', [])[-self.max_size:]:
+                self.entries[key] = category
+        return self
+    
+    def get(self, key):
+        """Return the cached category for a signature, or None"""
+        category = self.entries.get(key)
+        if category is not None:
+            self.entries.move_to_end(key)
+        return category
+    
+    def put(self, key, category):
+        """Remember the category of a signature, evicting the least recently used"""
+        self.entries[key] = category
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        if self.track_new:
+            self.new_entries.append((key, category))
+    
+    def drain_new(self):
+        """Return and forget the entries added since the last call"""
+        new_entries = self.new_entries
+        self.new_entries = []
+        return new_entries
+    
+    def save(self):
+        """Write the entries (least recently used first) if a cache file is set"""
+        if self.path is None:
+            return
+        tmp_path = str(self.path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rules_version': self.rules_version,
+                       'entries': list(self.entries.items())}, f)
+        os.replace(tmp_path, self.path)
+        print(f"Classification cache saved to: {self.path}")
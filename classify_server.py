@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Classify Server - HTTP service that categorizes emails and extracts contacts with warm rules
+"""
+
+import argparse
+import base64
+import binascii
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+
+from email_classifier import EmailClassifier
+from pipeline_metrics import StageMetrics, bucket_seconds
+
+
+def response_fields(result):
+    """Return the JSON response for one EmailClassifier result"""
+    contact = result['contact'] or {}
+    return {
+        'name': result['name'],
+        'category': result['category'],
+        'from': result['from'],
+        'subject': result['subject'],
+        'emails': contact.get('emails', []),
+        'phones': contact.get('phones', []),
+        'names': contact.get('names', []),
+        'title': contact.get('title', ''),
+        'company': contact.get('company_enriched', contact.get('company', '')),
+        'lead_score': contact.get('lead_score'),
+    }
+
+
+class ClassifyServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server holding one warm EmailClassifier
+    
+    Requests are handled on their own threads; classification itself
+    takes a lock, since the classifier keeps counters (and optionally a
+    cache) that are not thread-safe and the work is CPU-bound anyway. Run
+    several processes (see serve) to use more cores. Latencies are
+    counted per process in a StageMetrics histogram.
+    """
+    
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, address, classifier, max_bytes=25 * 1024 * 1024, verbose=False):
+        super().__init__(address, ClassifyHandler)
+        self.classifier = classifier
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.metrics = StageMetrics('http', unit='requests')
+        self.latency_sum = 0.0
+    
+    def classify(self, messages):
+        """Classify (message, name) pairs and return their response dicts"""
+        with self.lock:
+            results = [response_fields(self.classifier.classify(message, name))
+                       for message, name in messages]
+            self.metrics.categories.update(result['category'] for result in results)
+        return results
+    
+    def observe(self, seconds, items, error=False):
+        with self.lock:
+            self.metrics.observe(seconds)
+            self.latency_sum += seconds
+            self.metrics.items += items
+            if error:
+                self.metrics.errors += 1
+    
+    def latency_report(self):
+        """Return the request latency histogram and percentiles as a JSON-ready dict"""
+        with self.lock:
+            report = self.metrics.to_dict()
+            buckets = sorted(self.metrics.latency.items())
+        report['pid'] = os.getpid()
+        report['requests'] = sum(count for _, count in buckets)
+        report['histogram'] = [{'le': round(bucket_seconds(bucket), 6), 'count': count}
+                               for bucket, count in buckets]
+        return report
+    
+    def prometheus_text(self):
+        """Return the request latency histogram in the Prometheus text format"""
+        with self.lock:
+            buckets = sorted(self.metrics.latency.items())
+            latency_sum = self.latency_sum
+            items = self.metrics.items
+            errors = self.metrics.errors
+        pid = os.getpid()
+        lines = [
+            '# HELP emailanalyzer_http_request_seconds Classification request latency.',
+            '# TYPE emailanalyzer_http_request_seconds histogram',
+        ]
+        cumulative = 0
+        for bucket, count in buckets:
+            cumulative += count
+            lines.append(f'emailanalyzer_http_request_seconds_bucket{{pid="{pid}",'
+                         f'le="{bucket_seconds(bucket):.6g}"}} {cumulative}')
+        lines.append(f'emailanalyzer_http_request_seconds_bucket{{pid="{pid}",le="+Inf"}} {cumulative}')
+        lines.append(f'emailanalyzer_http_request_seconds_sum{{pid="{pid}"}} {latency_sum:.6f}')
+        lines.append(f'emailanalyzer_http_request_seconds_count{{pid="{pid}"}} {cumulative}')
+        lines += [
+            '# HELP emailanalyzer_http_emails_classified Emails classified by this process.',
+            '# TYPE emailanalyzer_http_emails_classified counter',
+            f'emailanalyzer_http_emails_classified{{pid="{pid}"}} {items}',
+            '# HELP emailanalyzer_http_request_errors Requests rejected as invalid.',
+            '# TYPE emailanalyzer_http_request_errors counter',
+            f'emailanalyzer_http_request_errors{{pid="{pid}"}} {errors}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class ClassifyHandler(BaseHTTPRequestHandler):
+    """Endpoints of the classification service
+    
+    - POST /classify: the body is one raw RFC 822 email; returns its result
+    - POST /classify/batch: the body is JSON {"messages": [...]} with raw
+      emails as strings (or base64 strings with "base64": true, and
+      optional "names"); returns {"results": [...]} in the same order
+    - GET /latency: request latency histogram and percentiles (JSON)
+    - GET /metrics: the same histogram in the Prometheus text format
+    - GET /health: {"status": "ok"}
+    
+    Invalid requests get a 400 and failures while classifying a 500, both
+    with a JSON {"error": ...} body, and are counted as errors.
+    """
+    
+    server_version = 'EmailAnalyzer'
+    # Keep-alive connections avoid a TCP handshake per email
+    protocol_version = 'HTTP/1.1'
+    
+    def do_POST(self):
+        start = time.perf_counter()
+        path = urlparse(self.path).path
+        try:
+            body = self._read_body()
+            if path == '/classify':
+                name = self.headers.get('X-Email-Name', 'message.eml')
+                response = self.server.classify([(body, name)])[0]
+                items = 1
+            elif path == '/classify/batch':
+                messages = self._batch_messages(json.loads(body))
+                response = {'results': self.server.classify(messages)}
+                items = len(messages)
+            else:
+                self._send_json(404, {'error': f'unknown endpoint: {path}'})
+                return
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            self.server.observe(time.perf_counter() - start, 0, error=True)
+            return
+        except Exception as e:
+            # The client still gets an answer when classification itself fails
+            self.log_error('error handling %s: %r', path, e)
+            self._send_json(500, {'error': f'internal error: {type(e).__name__}'})
+            self.server.observe(time.perf_counter() - start, 0, error=True)
+            return
+        self._send_json(200, response)
+        self.server.observe(time.perf_counter() - start, items)
+    
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/latency':
+            self._send_json(200, self.server.latency_report())
+        elif path == '/metrics':
+            self._send(200, self.server.prometheus_text().encode('utf-8'),
+                       'text/plain; version=0.0.4')
+        else:
+            self._send_json(404, {'error': f'unknown endpoint: {path}'})
+    
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise ValueError('empty request body')
+        if length > self.server.max_bytes:
+            # The body is not read, so the connection can't be reused
+            self.close_connection = True
+            raise ValueError(f'request body larger than {self.server.max_bytes} bytes')
+        return self.rfile.read(length)
+    
+    def _batch_messages(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get('messages'), list):
+            raise ValueError('expected a JSON object with a "messages" list')
+        messages = request['messages']
+        if not all(isinstance(message, str) for message in messages):
+            raise ValueError('"messages" must hold raw emails as strings')
+        names = request.get('names') or [f"message{index}.eml" for index in range(len(messages))]
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError('"names" must be a list of strings')
+        if len(names) != len(messages):
+            raise ValueError('"names" must have one name per message')
+        if request.get('base64'):
+            try:
+                messages = [base64.b64decode(message, validate=True) for message in messages]
+            except binascii.Error as e:
+                raise ValueError(f'"messages" must be valid base64 strings ({e})')
+        return list(zip(messages, names))
+    
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json')
+    
+    def _send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(host='127.0.0.1', port=8025, processes=1, cache_size=0, verbose=False):
+    """Serve until interrupted, with ``processes`` pre-forked processes sharing the socket
+    
+    The classifier is created before forking, so every process starts
+    with compiled rules. Without os.fork (Windows) a single process is used.
+    """
+    classifier = EmailClassifier(cache_size=cache_size)
+    server = ClassifyServer((host, port), classifier, verbose=verbose)
+    print(f"Classifying emails on http://{host}:{server.server_address[1]}/classify "
+          f"(Ctrl+C to stop)")
+    
+    children = []
+    if hasattr(os, 'fork'):
+        for _ in range(processes - 1):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+                finally:
+                    os._exit(0)
+            children.append(pid)
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.server_close()
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Serve email classification over HTTP')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8025,
+                        help='port to listen on (default: 8025)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='pre-forked server processes sharing the port (default: 1)')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='reuse categories of repeated and near-identical emails, keeping up '
+                             'to this many signatures per process (default: 0, no cache)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='log every request')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    # Stop cleanly when a service manager sends SIGTERM (forked processes
+    # inherit the handler)
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    
+    serve(args.host, args.port, max(1, args.processes), args.cache_size, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
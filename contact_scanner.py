@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Contact Scanner - Finds phone, email, title and company candidates in an email body
+"""
+
+import re
+
+
+# Phone number patterns, applied in this order (US/Canada, international,
+# standard); a match is kept when its digits (and '+') number 10 or more
+PHONE_PATTERNS = [
+    r'\+?1?\s*\(?(\d{3})\)?[\s.-]?(\d{3})[\s.-]?(\d{4})',  # US/Canada
+    r'\+\d{1,3}\s*\d{1,14}',  # International
+    r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}',  # Standard
+]
+
+# Every phone pattern only matches these characters, so a kept number lies
+# inside a run of them at least 10 long with at least 9 digits
+PHONE_RUN = r'[\d\s.()+-]{10,}'
+MIN_PHONE_RUN_DIGITS = 9
+
+EMAIL_PATTERN = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
+
+# Words holding an '@' are delimited with these (other whitespace only
+# makes a word longer than needed)
+ASCII_WHITESPACE = ' \t\n\r\f\v'
+
+# Addresses containing any of these are system senders, not contacts
+SYSTEM_EMAIL_PARTS = ['noreply', 'no-reply', 'mailer-daemon', 'postmaster',
+                      'donotreply', 'do-not-reply', 'bounce', 'notification']
+
+TITLE_PATTERN = (r'\b(CEO|CTO|CFO|COO|CMO|VP|Director|Manager|Lead|Head|Chief|President|Senior|'
+                 r'Junior|Specialist|Engineer|Developer|Analyst|Coordinator|Administrator)\b')
+
+# Company names often follow "at" or "@"
+COMPANY_PATTERN = r'(?:at|@)\s+([A-Z][A-Za-z0-9\s&.,]+(?:Inc|LLC|Ltd|Corp|Co|Company)?)'
+
+# "On <date>, <name> wrote:" (Gmail, Apple Mail, Thunderbird) and its
+# translations, possibly wrapped over two lines: the line above a quoted
+# reply. The verb and colon end a line, the opener starts that line or the
+# one before, and a digit, comma or '@' (from the date or address) comes in
+# between, so sentences such as "On the other hand we wrote:" don't match.
+REPLY_ATTRIBUTION_VERB = r'\b(?:wrote|a écrit|schrieb|escribió|ha scritto|schreef)[ \t]?\Z'
+# The verb is looked for in this many characters before a colon ending a line
+MAX_VERB_CHARS = 12
+REPLY_ATTRIBUTION_OPENER = r'[ \t>]*(?:On|Le|Am|El|Il|Op)\b'
+REPLY_ATTRIBUTION_ANCHOR = r'[\d,@]'
+# Characters allowed between the opener and the verb on each of the lines
+MAX_ATTRIBUTION_LINE = 250
+
+# Lines starting a copy of an earlier message (a forward, or a reply with
+# the original below it); everything after them is someone else's text
+MESSAGE_SEPARATOR_PATTERNS = [
+    r'^[ \t]*-{2,}[ \t]*Original Message[ \t]*-{2,}',  # Outlook, Lotus Notes
+    r'^[ \t]*-{2,}[ \t]*Forwarded message[ \t]*-{2,}',  # Gmail forward
+    r'^[ \t]*Begin forwarded message:',  # Apple Mail forward
+    r'^[ \t]*\*?From:\*?[ \t][^\n]*\n[ \t]*\*?(?:Sent|Date):\*?[ \t]',  # Outlook header block
+]
+
+# Every attribution or separator holds one of these (lowercased), so text
+# without any of them is not searched
+REPLY_ATTRIBUTION_MARKERS = ['wrote', 'a écrit', 'schrieb', 'escribió', 'ha scritto', 'schreef']
+MESSAGE_SEPARATOR_MARKERS = ['original message', 'forwarded message', 'from:']
+
+# The signature is looked for in the first lines of the body, skipping long lines
+SIGNATURE_LINES = 15
+MAX_SIGNATURE_LINE = 100
+
+
+class ContactScanner:
+    """Extracts contact candidates from a body with patterns compiled once
+    
+    The phone patterns are only run on the runs of digits, spaces and
+    punctuation that could hold a number, found in one pass over the body;
+    email addresses are only looked for when the body has an '@', and
+    title and company only in the first SIGNATURE_LINES lines. The results
+    are the same as matching every pattern against the whole body.
+    
+    new_text leaves out the quoted history of replies and forwards, whose
+    addresses and numbers are mostly our own.
+    """
+    
+    def __init__(self):
+        self.phone_run = re.compile(PHONE_RUN)
+        self.phone_patterns = [re.compile(pattern) for pattern in PHONE_PATTERNS]
+        self.phone_junk = re.compile(r'[^\d+]')
+        self.non_digits = re.compile(r'\D')
+        self.email = re.compile(EMAIL_PATTERN)
+        self.word = re.compile(r'\S*')
+        self.system_email = re.compile('|'.join(re.escape(part) for part in SYSTEM_EMAIL_PARTS))
+        self.title = re.compile(TITLE_PATTERN, re.IGNORECASE)
+        self.company = re.compile(COMPANY_PATTERN)
+        self.line_end_colon = re.compile(r':[ \t\r]*$', re.MULTILINE)
+        self.attribution_verb = re.compile(REPLY_ATTRIBUTION_VERB, re.IGNORECASE)
+        self.attribution_opener = re.compile(REPLY_ATTRIBUTION_OPENER, re.IGNORECASE)
+        self.attribution_anchor = re.compile(REPLY_ATTRIBUTION_ANCHOR)
+        self.message_separator = re.compile('|'.join(MESSAGE_SEPARATOR_PATTERNS),
+                                            re.MULTILINE | re.IGNORECASE)
+        self.quoted_line = re.compile(r'^[ \t]*>[^\n]*\n?', re.MULTILINE)
+    
+    def new_text(self, text):
+        """Return the part of an email written by its sender, without the quoted history
+        
+        The text is cut at the first line where quoted history starts (a
+        reply attribution or one of MESSAGE_SEPARATOR_PATTERNS) and
+        the lines quoted with '>' are dropped. When nothing is left, a
+        message separator means a forward without comment and nothing was
+        written by the sender (''); otherwise the reply was written below
+        the quote, so only the attribution line and the quoted lines are
+        dropped, and when that leaves nothing either the text is returned
+        unchanged.
+        """
+        if not text:
+            return text
+        lowered = text.lower()
+        boundary = None
+        if any(marker in lowered for marker in REPLY_ATTRIBUTION_MARKERS):
+            boundary = self._attribution(text)
+        separator = None
+        if any(marker in lowered for marker in MESSAGE_SEPARATOR_MARKERS):
+            # Only a separator above the attribution can come first
+            separator = self.message_separator.search(text, 0, boundary[0] if boundary else len(text))
+        if separator:
+            boundary = separator.span()
+        head = text[:boundary[0]] if boundary else text
+        if '>' in head:
+            head = self.quoted_line.sub('', head)
+        if head.strip():
+            return head
+        if separator:
+            return ''
+        unquoted = text[:boundary[0]] + text[boundary[1]:] if boundary else text
+        if '>' in unquoted:
+            unquoted = self.quoted_line.sub('', unquoted)
+        return unquoted if unquoted.strip() else text
+    
+    def _attribution(self, text):
+        """Return the (start, end) of the first "On ... wrote:" line(s) in a text, or None
+        
+        Lines ending in a colon are found first, then the verb just before
+        the colon, and only that line and the one above it are checked for
+        the opener, which keeps the search linear on long lines.
+        """
+        for colon in self.line_end_colon.finditer(text):
+            verb = self.attribution_verb.search(text, max(0, colon.start() - MAX_VERB_CHARS),
+                                                colon.start())
+            if verb is None:
+                continue
+            line_start = text.rfind('\n', 0, verb.start()) + 1
+            starts = [line_start]
+            if line_start:
+                # The attribution wrapped over two lines starts earlier
+                starts.insert(0, text.rfind('\n', 0, line_start - 1) + 1)
+            for start in starts:
+                opener = self.attribution_opener.match(text, start)
+                if opener is None or opener.end() > verb.start():
+                    continue
+                lines = text[opener.end():verb.start()].split('\n')
+                if (all(len(line) <= MAX_ATTRIBUTION_LINE for line in lines) and
+                        self.attribution_anchor.search(text, opener.end(), verb.start())):
+                    return start, colon.end()
+        return None
+    
+    def scan(self, text):
+        """Return {'phones': [...], 'emails': [...]} plus 'title' and 'company' when found"""
+        found = {'phones': self.phones(text), 'emails': self.emails(text)}
+        found.update(self.signature(text))
+        return found
+    
+    def phones(self, text):
+        """Return the phone numbers in a text, as digits with an optional leading '+'"""
+        if not text:
+            return []
+        # No pattern matches '#', so joined runs are matched as if separate
+        runs = '#'.join(run for run in self.phone_run.findall(text)
+                        if len(self.non_digits.sub('', run)) >= MIN_PHONE_RUN_DIGITS)
+        phones = []
+        if not runs:
+            return phones
+        for pattern in self.phone_patterns:
+            for match in pattern.findall(runs):
+                if isinstance(match, tuple):
+                    match = ''.join(match)
+                phone = self.phone_junk.sub('', match)
+                if len(phone) >= 10:
+                    phones.append(phone)
+        return list(dict.fromkeys(phones))
+    
+    def emails(self, text):
+        """Return the lowercased email addresses in a text, without system senders"""
+        if not text or '@' not in text:
+            return []
+        emails = []
+        for address in self.email.findall(self._around_at_signs(text)):
+            address = address.lower()
+            if not self.system_email.search(address):
+                emails.append(address)
+        return list(dict.fromkeys(emails))
+    
+    def _around_at_signs(self, text):
+        """Return the whitespace-delimited words holding an '@', one per line
+        
+        Addresses never contain whitespace, and a word boundary next to
+        whitespace is the same as at the end of the text, so the email
+        pattern finds the same addresses here as in the whole text.
+        """
+        words = []
+        end = 0
+        at = text.find('@')
+        while at != -1:
+            # Searching back only to the previous word keeps this linear
+            start = max(end, max(text.rfind(space, end, at) for space in ASCII_WHITESPACE) + 1)
+            end = self.word.match(text, at).end()
+            words.append(text[start:end])
+            at = text.find('@', end)
+        return '\n'.join(words)
+    
+    def signature(self, text):
+        """Return the 'title' and 'company' found in the signature lines, if any"""
+        info = {}
+        if not text:
+            return info
+        for line in text.split('\n', SIGNATURE_LINES)[:SIGNATURE_LINES]:
+            line = line.strip()
+            if not line or len(line) > MAX_SIGNATURE_LINE:
+                continue
+            if self.title.search(line):
+                info['title'] = line
+            company_match = self.company.search(line)
+            if company_match:
+                info['company'] = company_match.group(1).strip()
+        return info
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Email Classifier - Categorizes emails and extracts contacts from messages held in memory
+"""
+
+import multiprocessing
+
+from analyze_emails import EmailAnalyzer
+from email_records import build_record
+from enrich_contacts import ContactEnricher
+from extract_contact_info import TARGET_CATEGORIES, ContactInfoExtractor
+
+
+class EmailClassifier:
+    """Library interface to the categorization rules and contact extraction
+    
+    Emails are passed as raw RFC 822 bytes (or str) or as already parsed
+    email.message.Message objects and nothing is read from or written to
+    disk. The same code as the batch pipeline is used:
+    EmailAnalyzer.categorize_email for the category, then build_record and
+    ContactInfoExtractor.extract_contact_from_record for the contact
+    details (only for ``contact_categories``; None extracts them for every
+    category) and ContactEnricher.enrich_contact for the lead score. The
+    rules are compiled when the classifier is created, so keep one
+    classifier and reuse it.
+    """
+    
+    def __init__(self, contact_categories=TARGET_CATEGORIES, score_leads=True, cache_size=0):
+        self.options = {
+            'contact_categories': contact_categories,
+            'score_leads': score_leads,
+            'cache_size': cache_size,
+        }
+        self.analyzer = EmailAnalyzer(None, cache_size=cache_size)
+        self.extractor = ContactInfoExtractor(None, categories_file=None)
+        self.enricher = ContactEnricher(contacts_file=None) if score_leads else None
+        self.contact_categories = set(contact_categories) if contact_categories is not None else None
+    
+    def classify(self, message, name='message.eml'):
+        """Return the category and contact details of one email
+        
+        The result is a dict with the ``name`` (used as the record path and
+        contact filename), ``category``, the ``from``, ``to``, ``subject``
+        and ``date`` headers and ``contact``: the extracted contact (emails,
+        phones, names, title, company, ...; enriched with a lead score
+        unless score_leads is False) or None when there is none.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            msg = self.analyzer.load_email(name, bytes(message))
+        else:
+            msg = message
+        
+        category = self.analyzer.categorize_email(name, msg)
+        result = {'name': name, 'category': category, 'from': '', 'to': '', 'subject': '',
+                  'date': '', 'contact': None}
+        if msg is None:
+            return result
+        for field, header in (('from', 'From'), ('to', 'To'), ('subject', 'Subject'), ('date', 'Date')):
+            result[field] = str(msg.get(header, ''))
+        
+        # The body is only decoded when a contact is extracted (or a rule
+        # needed it)
+        if self.contact_categories is None or category in self.contact_categories:
+            record = build_record(name, msg, category, body=getattr(msg, 'body', None))
+            contact = self.extractor.extract_contact_from_record(record, category)
+            if contact and self.enricher is not None:
+                contact = self.enricher.enrich_contact(contact)
+            result['contact'] = contact
+        return result
+    
+    def classify_batch(self, messages, names=None, workers=1, chunk_size=100):
+        """Classify many emails and return their results in input order
+        
+        ``names`` defaults to message0.eml, message1.eml, ... With several
+        ``workers`` the emails are classified in a process pool, each
+        process with its own classifier, ``chunk_size`` emails at a time.
+        """
+        messages = list(messages)
+        if names is None:
+            names = [f"message{index}.eml" for index in range(len(messages))]
+        if workers <= 1 or len(messages) <= chunk_size:
+            return [self.classify(message, name) for message, name in zip(messages, names)]
+        
+        with multiprocessing.Pool(workers, initializer=_init_classifier,
+                                  initargs=(self.options,)) as pool:
+            return pool.starmap(_classify, zip(messages, names), chunksize=chunk_size)
+
+
+# Classifier used by each worker process of EmailClassifier.classify_batch
+_worker_classifier = None
+
+
+def _init_classifier(options):
+    """Create the per-process classifier used by _classify"""
+    global _worker_classifier
+    _worker_classifier = EmailClassifier(**options)
+
+
+def _classify(message, name):
+    return _worker_classifier.classify(message, name)
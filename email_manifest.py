@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Email Manifest - Remembers analyzed files so unchanged emails can be skipped
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def file_digest(data):
+    """Return the content hash stored in the manifest for raw email bytes"""
+    return hashlib.sha1(data).hexdigest()
+
+
+class EmailManifest:
+    """Persisted record of every analyzed email file and its category
+    
+    Entries are keyed by mail source identifier (the path relative to the
+    emails directory for .eml files) and hold the size, modification token
+    (mtime in nanoseconds for files), SHA-1 of the content and the category
+    computed for it. ``rules_version`` identifies the categorization rules
+    the categories were computed with; a manifest written with different
+    rules is ignored so every email is categorized again.
+    """
+    
+    def __init__(self, path, rules_version):
+        self.path = Path(path)
+        self.rules_version = rules_version
+        self.entries = {}
+        self.current = {}
+        self._stat = {}
+    
+    def load(self):
+        """Load the previous manifest if there is a usable one"""
+        if not self.path.exists():
+            return self
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('rules_version') == self.rules_version:
+            self.entries = data.get('files', {})
+        else:
+            print(f"Categorization rules changed since {self.path} was written; "
+                  f"re-analyzing all emails")
+        return self
+    
+    def lookup(self, rel_path, source):
+        """Return the stored category if the email is unchanged, otherwise None
+        
+        An email is unchanged when its size and mtime match the manifest, or
+        when only the mtime differs (or the source has no mtimes) but the
+        content hash is the same.
+        """
+        size, mtime = source.stat(rel_path)
+        # Remembered for update(), so a file modified while it is being
+        # analyzed is picked up again by the next run
+        self._stat[rel_path] = (size, mtime)
+        entry = self.entries.get(rel_path)
+        if entry is None or entry['size'] != size:
+            return None
+        
+        if mtime is None or entry['mtime'] != mtime:
+            if file_digest(source.read(rel_path)) != entry['sha1']:
+                return None
+        
+        self.current[rel_path] = dict(entry, mtime=mtime)
+        return entry['category']
+    
+    def update(self, rel_path, digest, category):
+        """Record the category computed for a new or changed file"""
+        size, mtime = self._stat.pop(rel_path)
+        self.current[rel_path] = {
+            'size': size,
+            'mtime': mtime,
+            'sha1': digest,
+            'category': category,
+        }
+    
+    def save(self):
+        """Write the entries seen in this run (deleted files are dropped)"""
+        tmp_path = str(self.path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rules_version': self.rules_version, 'files': self.current}, f)
+        os.replace(tmp_path, self.path)
+        print(f"Manifest saved to: {self.path}")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Email Records - Parse-once message records shared by the pipeline stages
+"""
+
+import json
+import os
+from pathlib import Path
+
+from html_text import MAX_TEXT_CHARS, html_to_text
+
+
+def load_categories(categories_file):
+    """Load categories.json, or the categories.jsonl written in streaming mode"""
+    with open(categories_file, 'r') as f:
+        if not str(categories_file).endswith('.jsonl'):
+            return json.load(f)
+        categories = {}
+        for line in f:
+            entry = json.loads(line)
+            categories.setdefault(entry['category'], []).append(entry['path'])
+        return categories
+
+
+# Version of what get_text_body returns; it is part of the analyzer's
+# rules_version, so manifests and caches written with bodies decoded
+# differently (before the HTML fallback: version 1) are not reused
+BODY_VERSION = 2
+
+
+def get_text_body(msg, max_html_chars=MAX_TEXT_CHARS):
+    """Return the decoded first text/plain part of a message ('' if none)
+    
+    HTML-only messages get the visible text of their first text/html part
+    instead, up to ``max_html_chars`` characters (see html_text).
+    """
+    try:
+        if msg.is_multipart():
+            html_part = None
+            for part in msg.walk():
+                content_type = part.get_content_type()
+                if content_type == 'text/plain':
+                    return part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                if (content_type == 'text/html' and html_part is None
+                        and part.get_content_disposition() != 'attachment'):
+                    html_part = part
+            if html_part is None:
+                return ''
+            html = html_part.get_payload(decode=True).decode('utf-8', errors='ignore')
+            return html_to_text(html, max_html_chars)
+        body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
+        if msg.get_content_type() == 'text/html':
+            return html_to_text(body, max_html_chars)
+        return body
+    except:
+        return ''
+
+
+COMPREHENSIVE_CSV_COLUMNS = [
+    'Email Filename',
+    'Category',
+    'Category Name',
+    'From',
+    'To',
+    'Subject',
+    'Date',
+    'Body Preview'
+]
+
+
+def comprehensive_row(email_file, category, category_name, record):
+    """Build a comprehensive_email_details.csv row from an email record"""
+    # Clean and limit body for CSV (first 500 chars for preview)
+    body = record['body']
+    if body:
+        body = body[:500].replace('\n', ' ').replace('\r', ' ').strip()
+    
+    return [
+        email_file,
+        category,
+        category_name,
+        record['from'],
+        record['to'],
+        record['subject'],
+        record['date'],
+        body
+    ]
+
+
+def build_record(rel_path, msg, category, body=None):
+    """Build the compact record stored for one parsed email
+    
+    ``body`` may be passed when the decoded text body is already known;
+    otherwise it is decoded from ``msg``. Returns None when the email could
+    not be parsed.
+    """
+    # A message without headers is empty (falsy) but still has a body
+    if msg is None:
+        return None
+    
+    if body is None:
+        body = get_text_body(msg)
+    
+    return {
+        'path': str(rel_path),
+        'category': category,
+        'from': str(msg.get('From', '')),
+        'to': str(msg.get('To', '')),
+        'subject': str(msg.get('Subject', '')),
+        'date': str(msg.get('Date', '')),
+        'reply_to': str(msg.get('Reply-To', '')),
+        'body': body,
+    }
+
+
+# Share of stale records (of changed or deleted emails) at which
+# RecordStore.compact rewrites a store
+COMPACT_STALE_SHARE = 0.25
+
+
+def source_key(location):
+    """Return the form of a mail source location stored with its records"""
+    return os.path.realpath(location) if location is not None else None
+
+
+class RecordStore:
+    """On-disk store of email records addressed by relative path
+    
+    Records are written as JSON Lines to ``path``. A sidecar index
+    (``path + '.idx'``, also JSON Lines) gets one [path, offset, length]
+    entry per record as it is written, so writing keeps nothing in memory
+    and readers can seek straight to a single record. When a path is
+    stored more than once the last entry wins. The first line of the index
+    is {"source": ...}, the absolute location of the mail source the
+    records were parsed from, since the same relative paths can exist in
+    another source.
+    """
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.index_path = Path(str(path) + '.idx')
+        self.index = {}
+        # Mail source of the stored records (None for stores written
+        # before it was recorded)
+        self.source = None
+        # Entries in the index file, including those of superseded records
+        self.entries = 0
+        self._writer = None
+        self._index_writer = None
+        self._reader = None
+    
+    def exists(self):
+        """Return True if both the store and its index are on disk"""
+        return self.path.exists() and self.index_path.exists()
+    
+    def open_for_writing(self, append=False, source=None):
+        """Start a new, empty store, or keep adding to an existing one
+        
+        In append mode the existing index is loaded, so the records already
+        stored can be looked up, and a record appended for a path that is
+        already stored replaces the old one. ``source`` is the location of
+        the mail source the records come from; a store of another source
+        is started afresh instead of appended to.
+        """
+        self.close()
+        if append and self.exists() and self.load().matches(source):
+            mode = 'a'
+        else:
+            self.index = {}
+            self.source = source_key(source)
+            self.entries = 0
+            mode = 'w'
+        self._writer = open(self.path, mode + 'b')
+        self._index_writer = open(self.index_path, mode, encoding='utf-8')
+        if mode == 'w':
+            self._index_writer.write(json.dumps({'source': self.source}) + '\n')
+    
+    def remove(self):
+        """Delete the store and its index, if they exist"""
+        self.close()
+        for path in (self.path, self.index_path):
+            if path.exists():
+                path.unlink()
+        self.index = {}
+        self.entries = 0
+    
+    def matches(self, source):
+        """Return True if the stored records were parsed from this mail source location"""
+        return self.source is not None and self.source == source_key(source)
+    
+    def append(self, record):
+        """Append a record and index it by its relative path"""
+        line = (json.dumps(record) + '\n').encode('ascii')
+        offset = self._writer.tell()
+        self._writer.write(line)
+        self._index_writer.write(json.dumps([record['path'], offset, len(line)]) + '\n')
+        self.entries += 1
+    
+    def flush(self):
+        """Push the records appended so far (and their index entries) to disk"""
+        self._writer.flush()
+        self._index_writer.flush()
+    
+    def load(self):
+        """Load the index of an existing store for reading"""
+        self.index = {}
+        self.source = None
+        self.entries = 0
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                if isinstance(entry, dict):
+                    self.source = entry.get('source')
+                    continue
+                path, offset, length = entry
+                self.index[path] = (offset, length)
+                self.entries += 1
+        return self
+    
+    def compact(self, keep=None, min_stale=COMPACT_STALE_SHARE):
+        """Rewrite the store with only the current records of the paths in ``keep``
+        
+        Appending never removes anything, so every incremental run leaves
+        the old records of changed emails (and those of deleted ones)
+        behind. When at least ``min_stale`` of the stored records are
+        superseded or not in ``keep`` (None keeps every path), the live
+        records are copied in their stored order to a new store and index
+        that replace the old ones. Returns the number of records dropped.
+        """
+        self.close()
+        if not self.exists():
+            return 0
+        self.load()
+        live = sorted((offset, length, path) for path, (offset, length) in self.index.items()
+                      if keep is None or path in keep)
+        stale = self.entries - len(live)
+        if not stale or stale < self.entries * min_stale:
+            return 0
+        
+        store_tmp = str(self.path) + '.tmp'
+        index_tmp = str(self.index_path) + '.tmp'
+        index = {}
+        with open(self.path, 'rb') as reader, open(store_tmp, 'wb') as writer, \
+                open(index_tmp, 'w', encoding='utf-8') as index_writer:
+            index_writer.write(json.dumps({'source': self.source}) + '\n')
+            for offset, length, path in live:
+                reader.seek(offset)
+                index[path] = (writer.tell(), length)
+                writer.write(reader.read(length))
+                index_writer.write(json.dumps([path, index[path][0], length]) + '\n')
+        os.replace(store_tmp, self.path)
+        os.replace(index_tmp, self.index_path)
+        self.index = index
+        self.entries = len(index)
+        return stale
+    
+    def get(self, rel_path):
+        """Return the record for a relative path, or None if it was not stored"""
+        entry = self.index.get(str(rel_path))
+        if entry is None:
+            return None
+        if self._reader is None:
+            self._reader = open(self.path, 'rb')
+        offset, length = entry
+        self._reader.seek(offset)
+        return json.loads(self._reader.read(length))
+    
+    def close(self):
+        """Close the files of a store being written or read"""
+        for handle in (self._writer, self._index_writer, self._reader):
+            if handle is not None:
+                handle.close()
+        self._writer = None
+        self._index_writer = None
+        self._reader = None
@@ -6,18 +6,26 @@ Contact Enrichment - Enriches contact information with additional data
 import json
 import csv
 import re
+import argparse
+import time
 from collections import defaultdict
 
+from pipeline_metrics import Progress, RunRecord, StageMetrics
+from results_db import ResultsDatabase
+
 
 class ContactEnricher:
     def __init__(self, contacts_file='extracted_contacts.json'):
         self.contacts_file = contacts_file
         self.contacts = []
         self.enriched_contacts = []
+        # Throughput and latency metrics of the last enrichment
+        self.metrics = None
         
-        # Load contacts
-        with open(contacts_file, 'r', encoding='utf-8') as f:
-            self.contacts = json.load(f)
+        # Load contacts (none when only saving already enriched contacts)
+        if contacts_file:
+            with open(contacts_file, 'r', encoding='utf-8') as f:
+                self.contacts = json.load(f)
     
     def extract_domain_info(self, email):
         """Extract domain and company info from email"""
@@ -160,67 +168,78 @@ class ContactEnricher:
         
         return score
     
+    def enrich_contact(self, contact):
+        """Return an enriched copy of one extracted contact"""
+        enriched = contact.copy()
+        
+        # Get primary email
+        primary_email = contact['emails'][0] if contact['emails'] else None
+        
+        if primary_email:
+            # Extract domain info
+            domain_info = self.extract_domain_info(primary_email)
+            if domain_info:
+                enriched['domain'] = domain_info['domain']
+                enriched['is_free_email'] = domain_info['is_free_email']
+                enriched['company_from_domain'] = domain_info['company_from_domain']
+            
+            # Infer name if not available
+            if not contact['names']:
+                inferred_name = self.infer_name_from_email(primary_email)
+                if inferred_name:
+                    enriched['inferred_name'] = inferred_name
+        
+        # Consolidate best name
+        if contact['names']:
+            # Use the longest name (likely most complete)
+            enriched['enriched_name'] = max(contact['names'], key=len)
+        elif enriched.get('inferred_name'):
+            enriched['enriched_name'] = enriched['inferred_name']
+        else:
+            enriched['enriched_name'] = ''
+        
+        # Consolidate best company
+        if contact['company']:
+            enriched['company_enriched'] = contact['company']
+        elif enriched.get('company_from_domain'):
+            enriched['company_enriched'] = enriched['company_from_domain']
+        else:
+            enriched['company_enriched'] = ''
+        
+        # Add LinkedIn search string
+        enriched['linkedin_search'] = self.extract_linkedin_potential(enriched)
+        
+        # Categorize response type
+        enriched['response_type'] = self.categorize_response_type(contact)
+        
+        # Calculate lead score
+        enriched['lead_score'] = self.calculate_lead_score(enriched)
+        
+        # Format phone numbers
+        if contact['phones']:
+            enriched['primary_phone'] = contact['phones'][0]
+        else:
+            enriched['primary_phone'] = ''
+        
+        return enriched
+    
     def enrich_all_contacts(self):
         """Enrich all contacts with additional information"""
         print(f"Enriching {len(self.contacts)} contacts...")
         
+        metrics = self.metrics = StageMetrics('enrich', unit='contacts')
+        progress = Progress('contacts enriched')
         for idx, contact in enumerate(self.contacts, 1):
-            if idx % 100 == 0:
-                print(f"Progress: {idx}/{len(self.contacts)} contacts enriched...")
-            
-            enriched = contact.copy()
-            
-            # Get primary email
-            primary_email = contact['emails'][0] if contact['emails'] else None
-            
-            if primary_email:
-                # Extract domain info
-                domain_info = self.extract_domain_info(primary_email)
-                if domain_info:
-                    enriched['domain'] = domain_info['domain']
-                    enriched['is_free_email'] = domain_info['is_free_email']
-                    enriched['company_from_domain'] = domain_info['company_from_domain']
-                
-                # Infer name if not available
-                if not contact['names']:
-                    inferred_name = self.infer_name_from_email(primary_email)
-                    if inferred_name:
-                        enriched['inferred_name'] = inferred_name
-            
-            # Consolidate best name
-            if contact['names']:
-                # Use the longest name (likely most complete)
-                enriched['enriched_name'] = max(contact['names'], key=len)
-            elif enriched.get('inferred_name'):
-                enriched['enriched_name'] = enriched['inferred_name']
-            else:
-                enriched['enriched_name'] = ''
-            
-            # Consolidate best company
-            if contact['company']:
-                enriched['company_enriched'] = contact['company']
-            elif enriched.get('company_from_domain'):
-                enriched['company_enriched'] = enriched['company_from_domain']
-            else:
-                enriched['company_enriched'] = ''
-            
-            # Add LinkedIn search string
-            enriched['linkedin_search'] = self.extract_linkedin_potential(enriched)
-            
-            # Categorize response type
-            enriched['response_type'] = self.categorize_response_type(contact)
-            
-            # Calculate lead score
-            enriched['lead_score'] = self.calculate_lead_score(enriched)
-            
-            # Format phone numbers
-            if contact['phones']:
-                enriched['primary_phone'] = contact['phones'][0]
-            else:
-                enriched['primary_phone'] = ''
+            progress.update(idx, len(self.contacts))
+            start = time.perf_counter()
             
+            enriched = self.enrich_contact(contact)
             self.enriched_contacts.append(enriched)
+            metrics.observe(time.perf_counter() - start)
+            metrics.categories[contact.get('category', '')] += 1
         
+        metrics.items = len(self.contacts)
+        metrics.finish()
         print(f"\n✓ Enriched {len(self.enriched_contacts)} contacts")
     
     def generate_statistics(self):
@@ -418,19 +437,25 @@ class ContactEnricher:
         print(f"✓ Exported {len(high_quality)} high quality leads to: {output_file}")
 
 
-def main():
-    import os
-    
-    if not os.path.exists('extracted_contacts.json'):
-        print("Error: extracted_contacts.json not found!")
-        print("Please run extract_contact_info.py first.")
-        return
-    
-    print("Starting contact enrichment...")
-    
-    # Create enricher
-    enricher = ContactEnricher('extracted_contacts.json')
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Enrich the extracted contacts')
+    parser.add_argument('--db',
+                        help='also save the enriched contacts to this SQLite results database')
+    parser.add_argument('--metrics',
+                        help='add throughput, latency and error metrics of the contact enrichment '
+                             'to this JSON run record (e.g. metrics.json)')
+    parser.add_argument('--metrics-prom',
+                        help='with --metrics, also write the metrics in Prometheus text format')
+    return parser.parse_args(argv)
+
+
+def enrich_and_save(enricher, db=None, metrics=None, metrics_prom=None):
+    """Enrich the loaded contacts, print the summary and write the output files
     
+    With ``metrics`` (a JSON run record path) the enrichment metrics are
+    added to it, and also written to ``metrics_prom`` in Prometheus format.
+    """
     # Enrich all contacts
     enricher.enrich_all_contacts()
     
@@ -442,11 +467,35 @@ def main():
     enricher.save_to_csv('enriched_contacts.csv')
     enricher.save_to_json('enriched_contacts.json')
     enricher.export_high_quality_leads('high_quality_leads.csv', min_score=70)
+    if db:
+        results_db = ResultsDatabase(db)
+        results_db.save_leads(enricher.enriched_contacts)
+        results_db.close()
+    if metrics:
+        RunRecord(metrics, metrics_prom).load().add_stage(enricher.metrics).save()
     
     print("\n✓ Contact enrichment complete!")
     print("  - Full database: enriched_contacts.csv / enriched_contacts.json")
     print("  - High quality leads: high_quality_leads.csv")
 
 
+def main(argv=None):
+    import os
+    
+    args = parse_args(argv)
+    
+    if not os.path.exists('extracted_contacts.json'):
+        print("Error: extracted_contacts.json not found!")
+        print("Please run extract_contact_info.py first.")
+        return
+    
+    print("Starting contact enrichment...")
+    
+    # Create enricher
+    enricher = ContactEnricher('extracted_contacts.json')
+    
+    enrich_and_save(enricher, args.db, args.metrics, args.metrics_prom)
+
+
 if __name__ == '__main__':
     main()
@@ -9,19 +9,84 @@ import email
 from email import policy
 from email.utils import parseaddr, getaddresses
 from pathlib import Path
+import argparse
 import json
 import csv
+import multiprocessing
+import time
+from collections import Counter, deque
+
+from contact_scanner import ContactScanner
+from email_records import RecordStore, build_record, load_categories
+from mail_sources import Prefetcher, default_source, open_source
+from pipeline_metrics import Progress, RunRecord, StageMetrics, latency_bucket
+from results_db import ResultsDatabase
+
+
+# Categories whose emails are most likely to hold contact details
+TARGET_CATEGORIES = [
+    'replies',
+    'out_of_office',
+    'automatic_replies',
+    'contact_info',
+]
+
+# A secondary email or phone found in contacts of more primary emails than
+# this is shared (a team mailbox, a switchboard) and does not link contacts
+MAX_KEY_IDENTITIES = 5
+
+NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_email(address):
+    """Return the form of an email address used to match contacts"""
+    return address.strip().lower()
+
+
+def normalize_phone(phone):
+    """Return the digits of a phone number used to match contacts, without a leading US/Canada 1"""
+    digits = NON_DIGITS.sub('', phone)
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits
 
 
 class ContactInfoExtractor:
-    def __init__(self, emails_dir, categories_file='categories.json'):
-        self.emails_dir = Path(emails_dir)
+    def __init__(self, emails_dir, categories_file='categories.json', records_file=None,
+                 prefetch_threads=0, prefetch_bytes=64 * 1024 * 1024, workers=1, chunk_size=200):
+        # Directory, .zip archive, mbox file or Maildir holding the emails;
+        # None when contacts are only extracted from records or messages
+        # passed in memory
+        self.emails_dir = Path(emails_dir) if emails_dir is not None else None
+        self.source = open_source(emails_dir) if emails_dir is not None else None
+        # Reads raw emails ahead of the parser when records are not available
+        self.prefetcher = Prefetcher(self.source, prefetch_threads, prefetch_bytes)
+        # Worker processes used by extract_from_categories, each sent
+        # chunk_size emails of one category at a time
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
         self.categories_file = categories_file
         self.contacts = []
-        
-        # Load categorized emails
-        with open(categories_file, 'r') as f:
-            self.categories = json.load(f)
+        # Statistics of the last deduplicate_contacts
+        self.cluster_stats = None
+        # Throughput, latency and error metrics of the last extraction
+        self.metrics = None
+        # Phone, email and signature patterns, compiled once
+        self.scanner = ContactScanner()
+        
+        # Load categorized emails (none when only saving contacts)
+        self.categories = load_categories(categories_file) if categories_file else {}
+        
+        # Parsed records written by analyze_emails.py, used instead of
+        # re-parsing the email files when available (and parsed from the
+        # same mail source)
+        self.records = None
+        if records_file and RecordStore(records_file).exists():
+            records = RecordStore(records_file).load()
+            if self.source is None or records.matches(self.source.location):
+                self.records = records
+            else:
+                print(f"Ignoring {records_file}: its records are not from {self.source.location}")
     
     def parse_email(self, filepath):
         """Parse an email file and return email object"""
@@ -33,99 +98,48 @@ class ContactInfoExtractor:
             print(f"Error parsing {filepath}: {e}")
             return None
     
+    def load_email(self, ident, raw=None):
+        """Parse an email, reading it from the mail source unless raw bytes are given (None if missing)"""
+        try:
+            if raw is None:
+                raw = self.source.read(ident)
+            return email.message_from_bytes(raw, policy=policy.default)
+        except (FileNotFoundError, KeyError):
+            return None
+        except Exception as e:
+            print(f"Error parsing {ident}: {e}")
+            return None
+    
     def extract_phone_numbers(self, text):
         """Extract phone numbers from text"""
-        if not text:
-            return []
-        
-        # Various phone number patterns
-        patterns = [
-            r'\+?1?\s*\(?(\d{3})\)?[\s.-]?(\d{3})[\s.-]?(\d{4})',  # US/Canada
-            r'\+\d{1,3}\s*\d{1,14}',  # International
-            r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}',  # Standard
-        ]
-        
-        phones = []
-        for pattern in patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                if isinstance(match, tuple):
-                    phone = ''.join(match)
-                else:
-                    phone = match
-                # Clean up
-                phone = re.sub(r'[^\d+]', '', phone)
-                if len(phone) >= 10:
-                    phones.append(phone)
-        
-        return list(set(phones))
+        return self.scanner.phones(text)
     
     def extract_alternate_emails(self, text):
         """Extract additional email addresses from text"""
-        if not text:
-            return []
-        
-        # Email pattern
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        emails = re.findall(email_pattern, text)
-        
-        # Filter out common system emails
-        system_emails = ['noreply', 'no-reply', 'mailer-daemon', 'postmaster', 
-                        'donotreply', 'do-not-reply', 'bounce', 'notification']
-        
-        filtered_emails = []
-        for e in emails:
-            if not any(sys in e.lower() for sys in system_emails):
-                filtered_emails.append(e.lower())
-        
-        return list(set(filtered_emails))
+        return self.scanner.emails(text)
     
     def extract_signature_info(self, text):
         """Extract name, title, company from email signature"""
-        if not text:
-            return {}
-        
-        info = {}
-        
-        # Look for common signature patterns
-        lines = text.split('\n')
-        
-        # Title patterns
-        title_keywords = [
-            r'\b(CEO|CTO|CFO|COO|CMO|VP|Director|Manager|Lead|Head|Chief|President|Senior|Junior|Specialist|Engineer|Developer|Analyst|Coordinator|Administrator)\b',
-        ]
-        
-        # Company patterns (often after "at", "@", or on separate line)
-        company_pattern = r'(?:at|@)\s+([A-Z][A-Za-z0-9\s&.,]+(?:Inc|LLC|Ltd|Corp|Co|Company)?)'
-        
-        for line in lines[:15]:  # Check first 15 lines for signature
-            line = line.strip()
-            if not line or len(line) > 100:
-                continue
-            
-            # Look for title
-            for pattern in title_keywords:
-                if re.search(pattern, line, re.IGNORECASE):
-                    info['title'] = line
-                    break
-            
-            # Look for company
-            company_match = re.search(company_pattern, line)
-            if company_match:
-                info['company'] = company_match.group(1).strip()
-        
-        return info
+        return self.scanner.signature(text)
     
     def extract_contact_from_email(self, filepath, category):
         """Extract all contact information from a single email"""
         msg = self.parse_email(filepath)
-        if not msg:
+        record = build_record(filepath.name, msg, category)
+        if not record:
             return None
         
+        return self.extract_contact_from_record(record, category)
+    
+    def extract_contact_from_record(self, record, category):
+        """Extract all contact information from a parsed email record"""
         contact = {
             'category': category,
-            'filename': str(filepath.name),
+            'filename': Path(record['path']).name,
             'emails': [],
+            # From and Reply-To addresses (the first of the emails), which
+            # identify the contact; the others are only mentioned in the body
+            'header_emails': [],
             'phones': [],
             'names': [],
             'title': '',
@@ -134,15 +148,17 @@ class ContactInfoExtractor:
             'date': '',
             'to': '',
             'body': '',
+            # Characters of quoted history left out of the extraction
+            'quoted_chars': 0,
         }
         
         # Get basic info from headers
-        contact['original_subject'] = msg.get('Subject', '')
-        contact['date'] = msg.get('Date', '')
-        contact['to'] = msg.get('To', '')
+        contact['original_subject'] = record['subject']
+        contact['date'] = record['date']
+        contact['to'] = record['to']
         
         # Extract from From header
-        from_header = msg.get('From', '')
+        from_header = record['from']
         from_name, from_email = parseaddr(from_header)
         
         if from_email and '@' in from_email:
@@ -156,7 +172,7 @@ class ContactInfoExtractor:
                 contact['names'].append(from_name)
         
         # Extract Reply-To if different
-        reply_to = msg.get('Reply-To', '')
+        reply_to = record['reply_to']
         if reply_to:
             reply_name, reply_email = parseaddr(reply_to)
             if reply_email and reply_email.lower() != from_email.lower():
@@ -167,44 +183,32 @@ class ContactInfoExtractor:
                 if reply_name and len(reply_name) > 2:
                     contact['names'].append(reply_name)
         
-        # Get email body
-        body = ''
-        try:
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == 'text/plain':
-                        body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                        break
-            else:
-                body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-        except:
-            pass
+        contact['header_emails'] = list(contact['emails'])
+        body = record['body']
         
         if body:
             # Store the body (limit to first 2000 chars for CSV compatibility)
             contact['body'] = body[:2000].replace('\n', ' ').replace('\r', ' ').strip()
             
-            # Extract phones
-            phones = self.extract_phone_numbers(body)
-            contact['phones'].extend(phones)
-            
-            # Extract alternate emails
-            alt_emails = self.extract_alternate_emails(body)
-            for e in alt_emails:
+            # Phones, alternate emails and signature info, from the text
+            # written by the sender only
+            new_text = self.scanner.new_text(body)
+            contact['quoted_chars'] = len(body) - len(new_text)
+            found = self.scanner.scan(new_text)
+            contact['phones'].extend(found['phones'])
+            for e in found['emails']:
                 if e not in contact['emails']:
                     contact['emails'].append(e)
-            
-            # Extract signature info
-            sig_info = self.extract_signature_info(body)
-            if 'title' in sig_info:
-                contact['title'] = sig_info['title']
-            if 'company' in sig_info:
-                contact['company'] = sig_info['company']
-        
-        # Remove duplicates
-        contact['emails'] = list(set(contact['emails']))
-        contact['phones'] = list(set(contact['phones']))
-        contact['names'] = list(set(contact['names']))
+            if 'title' in found:
+                contact['title'] = found['title']
+            if 'company' in found:
+                contact['company'] = found['company']
+        
+        # Remove duplicates (keeping the first occurrence, so the From
+        # address stays the primary email)
+        contact['emails'] = list(dict.fromkeys(contact['emails']))
+        contact['phones'] = list(dict.fromkeys(contact['phones']))
+        contact['names'] = list(dict.fromkeys(contact['names']))
         
         # Only return if we have useful info
         if contact['emails'] or contact['phones'] or contact['names']:
@@ -216,12 +220,7 @@ class ContactInfoExtractor:
         """Extract contacts from specific categories"""
         if target_categories is None:
             # Default: categories that likely have useful contact info
-            target_categories = [
-                'replies',
-                'out_of_office',
-                'automatic_replies',
-                'contact_info',
-            ]
+            target_categories = TARGET_CATEGORIES
         
         print(f"Extracting contact information from categories: {', '.join(target_categories)}")
         
@@ -232,67 +231,200 @@ class ContactInfoExtractor:
         
         print(f"Processing {total_emails} emails...")
         
-        processed = 0
-        for category in target_categories:
-            if category not in self.categories:
-                continue
-            
-            email_files = self.categories[category]
-            for email_file in email_files:
-                processed += 1
-                if processed % 100 == 0:
-                    print(f"Progress: {processed}/{total_emails} emails processed...")
-                
-                filepath = self.emails_dir / email_file
-                if not filepath.exists():
-                    continue
-                
-                contact = self.extract_contact_from_email(filepath, category)
-                if contact:
-                    self.contacts.append(contact)
+        metrics = self.metrics = StageMetrics('extract')
+        progress = Progress('emails processed')
+        if self.workers > 1:
+            results = self._extract_parallel(target_categories)
+        else:
+            results = (result for category in target_categories if category in self.categories
+                       for result in self._extract_serial(category, self.categories[category]))
         
+        processed = 0
+        for category, contact, error in results:
+            processed += 1
+            progress.update(processed, total_emails)
+            if contact:
+                self.contacts.append(contact)
+            if error:
+                metrics.errors += 1
+            metrics.categories[category] += 1
+        
+        metrics.items = processed
+        metrics.finish()
         print(f"\n✓ Extracted information from {len(self.contacts)} emails")
         return self.contacts
     
-    def deduplicate_contacts(self):
-        """Merge contacts with same email address"""
-        email_to_contact = {}
-        
-        for contact in self.contacts:
-            primary_email = contact['emails'][0] if contact['emails'] else None
-            
-            if not primary_email:
-                continue
-            
-            if primary_email in email_to_contact:
-                # Merge with existing
-                existing = email_to_contact[primary_email]
-                
-                # Merge emails
-                for e in contact['emails']:
-                    if e not in existing['emails']:
-                        existing['emails'].append(e)
-                
-                # Merge phones
-                for p in contact['phones']:
-                    if p not in existing['phones']:
-                        existing['phones'].append(p)
-                
-                # Merge names
-                for n in contact['names']:
-                    if n not in existing['names']:
-                        existing['names'].append(n)
-                
-                # Keep non-empty title and company
-                if not existing['title'] and contact['title']:
-                    existing['title'] = contact['title']
-                if not existing['company'] and contact['company']:
-                    existing['company'] = contact['company']
+    def _extract_serial(self, category, email_files):
+        """Yield (category, contact, error) for each email of a category in the current process
+        
+        The contact is None when the email has no contact details, and error
+        is True when the email is missing or could not be parsed. Latencies
+        are counted in self.metrics. Emails missing from the record store
+        are read from the mail source.
+        """
+        if self.records is not None:
+            emails = ((email_file, None) for email_file in email_files)
+        else:
+            emails = self.prefetcher.read(email_files)
+        
+        for email_file, raw in emails:
+            start = time.perf_counter()
+            if self.records is not None:
+                record = self.records.get(email_file)
+                if record is None and self.source is not None:
+                    # Not stored (e.g. analyzed with --no-records since)
+                    record = build_record(email_file, self.load_email(email_file), category)
             else:
-                email_to_contact[primary_email] = contact
-        
-        self.contacts = list(email_to_contact.values())
+                record = build_record(email_file, self.load_email(email_file, raw), category)
+            
+            contact = self.extract_contact_from_record(record, category) if record else None
+            self.metrics.observe(time.perf_counter() - start)
+            yield category, contact, record is None
+    
+    def _extract_parallel(self, target_categories):
+        """Yield (category, contact, error) for each email using a process pool
+        
+        The emails of each category are sent in chunks of ``chunk_size``,
+        with two chunks per worker in flight, and the chunk results are
+        consumed in submission order, so the contacts are in the same order
+        as in a serial run. With a record store each chunk carries the index
+        entries of its records and the workers read and parse them; without
+        one the workers read the emails from the mail source.
+        """
+        def chunks():
+            for category in target_categories:
+                email_files = self.categories.get(category, [])
+                for start in range(0, len(email_files), self.chunk_size):
+                    chunk = email_files[start:start + self.chunk_size]
+                    index = None
+                    if self.records is not None:
+                        index = {str(f): self.records.index[str(f)] for f in chunk
+                                 if str(f) in self.records.index}
+                    yield category, chunk, index
+        
+        print(f"Extracting with {self.workers} worker processes "
+              f"(chunks of up to {self.chunk_size} emails)...")
+        
+        location = self.source.location if self.source is not None else None
+        records_file = str(self.records.path) if self.records is not None else None
+        with multiprocessing.Pool(self.workers, initializer=_init_extract_worker,
+                                  initargs=(location, records_file, self.prefetcher.threads,
+                                            self.prefetcher.max_bytes)) as pool:
+            pending = chunks()
+            in_flight = deque()
+            while True:
+                while len(in_flight) < self.workers * 2:
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    in_flight.append(pool.apply_async(_extract_chunk, chunk))
+                if not in_flight:
+                    return
+                results, latency = in_flight.popleft().get()
+                self.metrics.latency.update(latency)
+                yield from results
+    
+    def deduplicate_contacts(self, max_key_identities=MAX_KEY_IDENTITIES):
+        """Merge contacts that share a sender address or phone number
+        
+        Contacts are linked when they share a From or Reply-To address or a
+        phone number (after normalize_email and normalize_phone), with a
+        union-find over a hash index of these keys, so the work stays
+        near-linear in the number of contacts. Addresses only mentioned in
+        the body often belong to someone else (a colleague to contact
+        instead) and don't link contacts. Apart from the primary email, a
+        key found in contacts of more than ``max_key_identities`` different
+        primary emails is shared (a team mailbox, a switchboard number) and
+        doesn't link them either. Each group is merged in extraction order
+        (see merge_cluster); groups without any email address are dropped.
+        Statistics about the groups are kept in self.cluster_stats.
+        """
+        contacts = self.contacts
+        
+        # Keys of each contact as (key, is primary email)
+        contact_keys = []
+        for contact in contacts:
+            header_emails = contact.get('header_emails', contact['emails'][:1])
+            keys = [(normalize_email(e), position == 0) for position, e in enumerate(header_emails)]
+            keys += [('tel:' + phone, False) for phone in map(normalize_phone, contact['phones']) if phone]
+            contact_keys.append(keys)
+        
+        # Primary emails of the contacts holding each key: a single value
+        # until a second one is seen, then a set of up to max_key_identities + 1
+        identities = {}
+        for contact, keys in zip(contacts, contact_keys):
+            primary = contact['emails'][0] if contact['emails'] else None
+            for key, _ in keys:
+                owners = identities.get(key, primary)
+                if isinstance(owners, set):
+                    if len(owners) <= max_key_identities:
+                        owners.add(primary)
+                elif owners != primary:
+                    identities[key] = {owners, primary}
+                else:
+                    identities[key] = owners
+        
+        parent = list(range(len(contacts)))
+        first = {}
+        shared = set()
+        secondary_links = 0
+        for index, keys in enumerate(contact_keys):
+            for key, is_primary in keys:
+                owners = identities[key]
+                if not is_primary and isinstance(owners, set) and len(owners) > max_key_identities:
+                    shared.add(key)
+                    continue
+                other = first.setdefault(key, index)
+                if other != index and _union(parent, other, index) and not is_primary:
+                    secondary_links += 1
+        
+        # Groups in order of their first contact
+        clusters = {}
+        for index, contact in enumerate(contacts):
+            clusters.setdefault(_find(parent, index), []).append(contact)
+        merged = [(self.merge_cluster(members), len(members)) for members in clusters.values()]
+        merged = [(contact, size) for contact, size in merged if contact['emails']]
+        self.contacts = [contact for contact, _ in merged]
+        
+        sizes = [size for _, size in merged]
+        self.cluster_stats = {
+            'contacts': len(contacts),
+            'identities': len(self.contacts),
+            'merged_identities': sum(1 for size in sizes if size > 1),
+            'largest_identity': max(sizes, default=0),
+            'secondary_links': secondary_links,
+            'shared_keys': len(shared),
+            'dropped_without_email': len(contacts) - sum(sizes),
+        }
         print(f"After deduplication: {len(self.contacts)} unique contacts")
+        stats = self.cluster_stats
+        print(f"  {stats['merged_identities']} merged from several contacts (largest: "
+              f"{stats['largest_identity']}), {stats['secondary_links']} links through a Reply-To "
+              f"address or phone, {stats['shared_keys']} shared keys not used for linking")
+    
+    @staticmethod
+    def merge_cluster(contacts):
+        """Merge the contacts of one identity into the first of them
+        
+        Emails, phones and names are kept once each in order of appearance,
+        and the first non-empty title and company win, so the result only
+        depends on the order of the contacts.
+        """
+        merged = contacts[0]
+        if len(contacts) == 1:
+            return merged
+        for field in ('emails', 'header_emails', 'phones', 'names'):
+            merged[field] = list(dict.fromkeys(value for contact in contacts
+                                               for value in contact.get(field, [])))
+        for field in ('title', 'company'):
+            if not merged[field]:
+                merged[field] = next((contact[field] for contact in contacts if contact[field]), '')
+        return merged
+    
+    @staticmethod
+    def merge_contact(existing, contact):
+        """Add the details of a contact with the same primary email to an existing one"""
+        return ContactInfoExtractor.merge_cluster([existing, contact])
     
     def save_to_csv(self, output_file='extracted_contacts.csv'):
         """Save contacts to CSV file"""
@@ -369,35 +501,158 @@ class ContactInfoExtractor:
         print("=" * 80)
 
 
-def main():
-    # Path to the emails directory
-    emails_dir = './relpies1114'
+def _find(parent, index):
+    """Return the root of a union-find set, halving the path on the way"""
+    while parent[index] != index:
+        parent[index] = parent[parent[index]]
+        index = parent[index]
+    return index
+
+
+def _union(parent, a, b):
+    """Join the sets of a and b under the smaller root; return False if they were joined already"""
+    a, b = _find(parent, a), _find(parent, b)
+    if a == b:
+        return False
+    if a < b:
+        parent[b] = a
+    else:
+        parent[a] = b
+    return True
+
+
+# Extractor used by each worker process of ContactInfoExtractor.extract_from_categories
+# or of a ContactExtractionStream
+_worker_extractor = None
+
+
+def _init_extract_worker(emails_dir=None, records_file=None, prefetch_threads=0,
+                         prefetch_bytes=64 * 1024 * 1024):
+    """Create the per-process extractor used by _extract_chunk and _extract_batch
     
-    if not os.path.exists(emails_dir):
-        print(f"Error: Directory '{emails_dir}' not found!")
-        print("Please run analyze_emails.py first to categorize the emails.")
-        return
+    A ContactExtractionStream sends the records with each batch, so its
+    workers open neither the mail source nor a record store.
+    """
+    global _worker_extractor
+    _worker_extractor = ContactInfoExtractor(emails_dir, categories_file=None,
+                                             prefetch_threads=prefetch_threads,
+                                             prefetch_bytes=prefetch_bytes)
+    if records_file:
+        # Only the index entries of a chunk's records are loaded (see _extract_chunk)
+        _worker_extractor.records = RecordStore(records_file)
+
+
+def _extract_chunk(category, email_files, index):
+    """Extract contacts from emails of one category inside a worker process
     
-    if not os.path.exists('categories.json'):
-        print("Error: categories.json not found!")
-        print("Please run analyze_emails.py first to categorize the emails.")
-        return
+    ``index`` holds the record store index entries of the emails (None
+    without a record store). Returns the (category, contact, error) results
+    in order and the extraction latencies by latency bucket.
+    """
+    extractor = _worker_extractor
+    if index is not None:
+        extractor.records.index = index
+    extractor.metrics = StageMetrics('extract')
+    results = list(extractor._extract_serial(category, email_files))
+    return results, extractor.metrics.latency
+
+
+def _extract_batch(batch):
+    """Extract contacts from (sort key, category, record) items inside a worker process
     
-    # Create extractor
-    extractor = ContactInfoExtractor(emails_dir)
+    Returns the (sort key, contact) results and the extraction latencies
+    by latency bucket.
+    """
+    results = []
+    latency = Counter()
+    for key, category, record in batch:
+        start = time.perf_counter()
+        contact = _worker_extractor.extract_contact_from_record(record, category)
+        if contact:
+            results.append((key, contact))
+        latency[latency_bucket(time.perf_counter() - start)] += 1
+    return results, latency
+
+
+class ContactExtractionStream:
+    """Extracts contacts from email records while the emails are still being categorized
     
-    # Extract from relevant categories
-    print("Starting contact information extraction...")
-    print("Targeting: replies, out_of_office, automatic_replies, and contact_info categories")
-    print()
+    Used as the consumer of EmailAnalyzer.analyze_all in the fused pipeline:
+    records of the target categories are sent in batches to extraction
+    worker processes, with at most two batches per worker in flight, so a
+    slow extraction holds categorization back instead of filling memory.
+    close() puts the contacts in the order extract_from_categories produces
+    (by target category, then in the order the emails were found).
+    """
+    
+    def __init__(self, extractor, target_categories=None, workers=1, batch_size=200):
+        self.extractor = extractor
+        self.positions = {category: position for position, category
+                          in enumerate(target_categories or TARGET_CATEGORIES)}
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.pool = None
+        self._batch = []
+        self._in_flight = deque()
+        self._results = []
+        self._seq = 0
+        self.metrics = StageMetrics('extract')
+    
+    def open(self):
+        """Start the extraction worker processes"""
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_extract_worker)
     
-    extractor.extract_from_categories([
-        'replies',
-        'out_of_office',
-        'automatic_replies',
-        'contact_info',
-    ])
+    def add(self, rel_path, category, record=None):
+        """Queue the record of one categorized email for extraction"""
+        position = self.positions.get(category)
+        if position is None:
+            return
+        self.metrics.items += 1
+        self.metrics.categories[category] += 1
+        if record is None:
+            # Missing or unparseable email
+            self.metrics.errors += 1
+            return
+        self._seq += 1
+        self._batch.append(((position, self._seq), category, record))
+        if len(self._batch) >= self.batch_size:
+            self._submit()
     
+    def _submit(self):
+        if self._batch:
+            self._in_flight.append(self.pool.apply_async(_extract_batch, (self._batch,)))
+            self._batch = []
+        while len(self._in_flight) > self.workers * 2:
+            self._collect()
+    
+    def _collect(self):
+        results, latency = self._in_flight.popleft().get()
+        self._results.extend(results)
+        self.metrics.latency.update(latency)
+    
+    def close(self):
+        """Wait for the workers and store the contacts on the extractor in output order"""
+        self._submit()
+        while self._in_flight:
+            self._collect()
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        
+        self._results.sort(key=lambda item: item[0])
+        self.extractor.contacts = [contact for _, contact in self._results]
+        self._results = []
+        self.extractor.metrics = self.metrics.finish()
+        print(f"\n✓ Extracted information from {len(self.extractor.contacts)} emails")
+        return self.extractor.contacts
+
+
+def save_results(extractor, db=None, metrics=None, metrics_prom=None):
+    """Deduplicate the extracted contacts, print the summary and write the output files
+    
+    With ``metrics`` (a JSON run record path) the extraction metrics are
+    added to it, and also written to ``metrics_prom`` in Prometheus format.
+    """
     # Deduplicate
     print("\nDeduplicating contacts...")
     extractor.deduplicate_contacts()
@@ -409,11 +664,80 @@ def main():
     print("\nSaving results...")
     extractor.save_to_csv('extracted_contacts.csv')
     extractor.save_to_json('extracted_contacts.json')
+    if db:
+        results_db = ResultsDatabase(db)
+        results_db.save_contacts(extractor.contacts)
+        results_db.close()
+    if metrics:
+        record = RunRecord(metrics, metrics_prom).load().add_stage(extractor.metrics)
+        record.data['identity_resolution'] = extractor.cluster_stats
+        record.save()
     
     print("\n✓ Contact extraction complete!")
     print("  - CSV format: extracted_contacts.csv")
     print("  - JSON format: extracted_contacts.json")
 
 
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Extract contact information from categorized emails')
+    parser.add_argument('--source',
+                        help='emails that were analyzed: a directory of .eml files, a .zip archive, '
+                             'an mbox file or a Maildir (default: ./relpies1114, or '
+                             './relpies1114.zip if the directory does not exist)')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='threads reading emails ahead of the parser when there is no '
+                             'email record store (default: 0, no read-ahead)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes used for contact extraction (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=200,
+                        help='number of emails sent to a worker at a time (default: 200)')
+    parser.add_argument('--db',
+                        help='also save the contacts to this SQLite results database')
+    parser.add_argument('--metrics',
+                        help='add throughput, latency and error metrics of the contact extraction '
+                             'to this JSON run record (e.g. metrics.json)')
+    parser.add_argument('--metrics-prom',
+                        help='with --metrics, also write the metrics in Prometheus text format')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    # Path to the emails: a directory, .zip archive, mbox file or Maildir
+    emails_dir = args.source or default_source('./relpies1114')
+    
+    if not os.path.exists(emails_dir):
+        print(f"Error: Directory '{emails_dir}' not found!")
+        print("Please run analyze_emails.py first to categorize the emails.")
+        return
+    
+    # categories.jsonl is written instead of categories.json by
+    # analyze_emails.py --stream; use whichever was written last
+    categories_files = [f for f in ('categories.json', 'categories.jsonl') if os.path.exists(f)]
+    if not categories_files:
+        print("Error: categories.json not found!")
+        print("Please run analyze_emails.py first to categorize the emails.")
+        return
+    categories_file = max(categories_files, key=os.path.getmtime)
+    
+    # Create extractor (reusing the parsed records from analyze_emails.py if present)
+    extractor = ContactInfoExtractor(emails_dir, categories_file, records_file='email_records.jsonl',
+                                     prefetch_threads=args.prefetch, workers=args.workers,
+                                     chunk_size=args.chunk_size)
+    if extractor.records is not None:
+        print("Using parsed email records from email_records.jsonl")
+    
+    # Extract from relevant categories
+    print("Starting contact information extraction...")
+    print("Targeting: replies, out_of_office, automatic_replies, and contact_info categories")
+    print()
+    
+    extractor.extract_from_categories(TARGET_CATEGORIES)
+    
+    save_results(extractor, args.db, args.metrics, args.metrics_prom)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+HTML Text - Converts HTML email bodies to plain text in one streaming pass
+"""
+
+import re
+from html.parser import HTMLParser
+
+
+# Characters of text kept from an HTML body; parsing stops once they are found
+MAX_TEXT_CHARS = 50000
+
+# Characters of HTML read at most; markup-heavy newsletters can hold little
+# text in megabytes of tables, and parsing costs about a second per 2 MB
+MAX_HTML_CHARS = 1000000
+
+# The HTML is fed to the parser this many characters at a time, so little
+# more than the part holding the kept text is ever parsed
+FEED_CHARS = 65536
+
+# Elements whose content is never shown as text
+SKIPPED_TAGS = {'script', 'style', 'title', 'noscript', 'template', 'svg', 'iframe', 'object'}
+
+# Elements without an end tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+             'param', 'source', 'track', 'wbr'}
+
+# Elements that start and end a line of text
+BLOCK_TAGS = {'address', 'article', 'aside', 'blockquote', 'center', 'dd', 'div', 'dl', 'dt',
+              'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'ol',
+              'p', 'pre', 'section', 'table', 'tr', 'ul'}
+
+# Elements whose end tag may be left out, with the start tags that end them
+# implicitly; an element also ends with its parent
+IMPLIED_END = {
+    'p': BLOCK_TAGS | {'fieldset', 'figure', 'main', 'menu', 'nav'},
+    'li': {'li'},
+    'dd': {'dd', 'dt'},
+    'dt': {'dd', 'dt'},
+    'td': {'td', 'th', 'tr', 'tbody', 'thead', 'tfoot'},
+    'th': {'td', 'th', 'tr', 'tbody', 'thead', 'tfoot'},
+    'tr': {'tr', 'tbody', 'thead', 'tfoot'},
+    'option': {'option', 'optgroup'},
+}
+
+# Elements inside which those start tags belong to a nested list or table
+# instead of ending the element
+IMPLIED_END_SCOPE = {
+    'li': {'ul', 'ol', 'menu'},
+    'dd': {'dl'},
+    'dt': {'dl'},
+    'td': {'table'},
+    'th': {'table'},
+    'tr': {'table'},
+    'option': {'select', 'datalist'},
+}
+
+# Inline styles of elements hidden from the reader (preheaders, tracking
+# and spam-filter text)
+HIDDEN_STYLE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all', re.IGNORECASE)
+
+
+class HTMLTextParser(HTMLParser):
+    """Collects the visible text of an HTML document as it is fed
+    
+    There is no document tree: text is written out as it arrives, with
+    block elements on their own lines, whitespace collapsed as a browser
+    would, and lines inside <blockquote> prefixed with '> ' like a quoted
+    plain-text reply. Scripts, styles and hidden elements are skipped;
+    images add no text, so tracking pixels leave nothing behind. Once
+    ``max_chars`` characters are collected ``done`` is set and the rest of
+    the input is ignored.
+    """
+    
+    def __init__(self, max_chars=MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self.done = False
+        self.at_line_start = True
+        self.space = False
+        self.quote_depth = 0
+        self.pre_depth = 0
+        # Tag of the skipped (or hidden) element being read, and the
+        # elements opened inside it that are still open
+        self.skip_tag = None
+        self.skip_open = []
+    
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, closed=tag in VOID_TAGS)
+    
+    def handle_startendtag(self, tag, attrs):
+        # A self-closed element (<br/>, an inline <svg .../> icon) has no
+        # content, so it is never skipped
+        self._start(tag, attrs, closed=True)
+    
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self.skip_tag and not self._end_skip(tag):
+            return
+        if tag in BLOCK_TAGS:
+            self._newline()
+            if tag == 'blockquote' and self.quote_depth:
+                self.quote_depth -= 1
+            elif tag == 'pre' and self.pre_depth:
+                self.pre_depth -= 1
+        elif tag in ('td', 'th'):
+            self.space = True
+    
+    def handle_data(self, data):
+        if self.done or self.skip_tag:
+            return
+        if self.pre_depth:
+            lines = data.split('\n')
+            for index, line in enumerate(lines):
+                if index:
+                    self._newline(force=True)
+                if line:
+                    self._write(line)
+            return
+        if not data.strip():
+            if data:
+                self.space = True
+            return
+        if data[0].isspace():
+            self.space = True
+        self._write(' '.join(data.split()))
+        if data[-1].isspace():
+            self.space = True
+    
+    def text(self):
+        """Return the text collected so far"""
+        return ''.join(self.parts).strip()
+    
+    def _start(self, tag, attrs, closed):
+        if self.done:
+            return
+        if self.skip_tag:
+            if not self._implicitly_ends_skip(tag):
+                # A second <p>, <li>... ends the first, so it is not stacked
+                if not closed and not (tag in IMPLIED_END and self.skip_open[-1:] == [tag]):
+                    self.skip_open.append(tag)
+                return
+            self.skip_tag = None
+        if not closed and (tag in SKIPPED_TAGS or self._hidden(attrs)):
+            self.skip_tag = tag
+            self.skip_open = []
+            return
+        if tag == 'br':
+            self._newline(force=True)
+        elif tag in BLOCK_TAGS:
+            self._newline()
+            # A self-closed <blockquote/> or <pre/> has nothing to quote or keep
+            if tag == 'blockquote' and not closed:
+                self.quote_depth += 1
+            elif tag == 'pre' and not closed:
+                self.pre_depth += 1
+        elif tag in ('td', 'th'):
+            self.space = True
+    
+    def _implicitly_ends_skip(self, tag):
+        """Return True if this start tag ends a skipped element left open (a <p>, <li>, <td>...)"""
+        if tag not in IMPLIED_END.get(self.skip_tag, ()):
+            return False
+        scope = IMPLIED_END_SCOPE.get(self.skip_tag, set())
+        return not scope.intersection(self.skip_open)
+    
+    def _end_skip(self, tag):
+        """Handle an end tag while skipping; return True if it ends the
+        skipped element and is also the end of an element being shown"""
+        if tag in self.skip_open:
+            # Also closes the elements opened after it
+            del self.skip_open[len(self.skip_open) - 1 - self.skip_open[::-1].index(tag):]
+            return False
+        if tag == self.skip_tag:
+            self.skip_tag = None
+            return False
+        if self.skip_tag in IMPLIED_END:
+            # The end tag of the parent of a <p>, <li>, <td>... left open
+            self.skip_tag = None
+            return True
+        # A stray end tag inside the skipped element
+        return False
+    
+    def _hidden(self, attrs):
+        for name, value in attrs:
+            if name == 'hidden' or (name == 'style' and value and HIDDEN_STYLE.search(value)):
+                return True
+        return False
+    
+    def _write(self, text):
+        if self.at_line_start:
+            if self.quote_depth:
+                text = '> ' * self.quote_depth + text
+        elif self.space:
+            text = ' ' + text
+        self.space = False
+        self.at_line_start = False
+        room = self.max_chars - self.length
+        if len(text) >= room:
+            text = text[:room]
+            self.done = True
+        self.parts.append(text)
+        self.length += len(text)
+    
+    def _newline(self, force=False):
+        """End the current line; ``force`` (<br>) also ends an empty one, up to one blank line"""
+        self.space = False
+        if self.at_line_start and not force:
+            return
+        if self.parts and self.parts[-1] == '\n' and len(self.parts) > 1 and self.parts[-2] == '\n':
+            return
+        self.parts.append('\n')
+        self.length += 1
+        self.at_line_start = True
+        if self.length >= self.max_chars:
+            self.done = True
+
+
+def html_to_text(html, max_chars=MAX_TEXT_CHARS, max_html=MAX_HTML_CHARS):
+    """Return the visible text of an HTML document, at most ``max_chars`` characters
+    
+    The HTML is parsed in FEED_CHARS pieces and parsing stops as soon as
+    the text is long enough, or after ``max_html`` characters of HTML, so
+    a multi-megabyte newsletter costs no more than its first screens.
+    
+    >>> print(html_to_text('<p style="display:none">x<p>visible text</p><div>more</div>'))
+    visible text
+    more
+    >>> print(html_to_text('<table><tr><td hidden>x<td>Jane Roe</table>VP Sales'))
+    Jane Roe
+    VP Sales
+    """
+    if not html:
+        return ''
+    parser = HTMLTextParser(max_chars)
+    try:
+        for start in range(0, min(len(html), max_html), FEED_CHARS):
+            parser.feed(html[start:min(start + FEED_CHARS, max_html)])
+            if parser.done:
+                break
+        else:
+            if len(html) <= max_html:
+                # Text after the last tag (a cut-off document ends mid-markup)
+                parser.close()
+    except AssertionError:
+        # Declarations the tokenizer can't parse end the text early
+        pass
+    return parser.text()
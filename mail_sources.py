@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Mail Sources - Reads raw emails from directories, zip archives, mbox files and Maildirs
+"""
+
+import mmap
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# Separates the source name from the member in message identifiers of
+# sources that are not plain directories, e.g. "relpies1114.zip!a/b.eml"
+MEMBER_SEPARATOR = '!'
+
+
+def _list_directory(path):
+    """Return the (file names, subdirectory names) of a directory in scandir order"""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+                except OSError:
+                    continue
+    except PermissionError:
+        pass
+    return files, subdirs
+
+
+class DirectorySource:
+    """.eml files anywhere below a directory
+    
+    Identifiers are paths relative to the directory, which keeps them the
+    same as in outputs written before other sources existed.
+    """
+    
+    def __init__(self, root, walk_threads=0):
+        self.location = str(root)
+        self.root = Path(root)
+        # Threads listing upcoming subdirectories while earlier ones are
+        # being processed (useful on network file systems)
+        self.walk_threads = walk_threads
+    
+    def identifiers(self):
+        """Yield the identifier of every email in the source as it is found
+        
+        The tree is walked with os.scandir in the same order as
+        Path.rglob('*.eml'): the emails of a directory, then each
+        subdirectory in turn (symlinked directories are not followed).
+        Nothing is collected up front, so the first emails are available
+        immediately even on very large trees.
+        """
+        executor = ThreadPoolExecutor(self.walk_threads) if self.walk_threads > 0 else None
+        lookahead = max(1, self.walk_threads) * 4
+        # Directories still to walk, as [relative prefix, listing future],
+        # with the next one to walk at the end
+        stack = [['', None]]
+        try:
+            while stack:
+                prefix, listing = stack.pop()
+                path = os.path.join(self.location, prefix)
+                files, subdirs = listing.result() if listing else _list_directory(path)
+                for name in files:
+                    if name.endswith('.eml'):
+                        yield prefix + name
+                stack.extend([prefix + name + os.sep, None] for name in reversed(subdirs))
+                if executor is not None:
+                    # List the next few directories in the background
+                    for entry in stack[-lookahead:]:
+                        if entry[1] is None:
+                            entry[1] = executor.submit(
+                                _list_directory, os.path.join(self.location, entry[0]))
+        finally:
+            if executor is not None:
+                for _, listing in stack:
+                    if listing is not None:
+                        listing.cancel()
+                executor.shutdown(wait=True)
+    
+    def read(self, ident):
+        """Return the raw bytes of an email"""
+        with open(self.root / ident, 'rb') as f:
+            return f.read()
+    
+    def stat(self, ident):
+        """Return (size, modification token) used to detect changed emails"""
+        st = os.stat(self.root / ident)
+        return st.st_size, st.st_mtime_ns
+
+
+class ZipSource:
+    """.eml members of a zip archive, read without extracting it"""
+    
+    def __init__(self, path):
+        self.location = str(path)
+        self.name = Path(path).name
+        self.prefix = self.name + MEMBER_SEPARATOR
+        self._zip = None
+        self._pid = None
+    
+    def _archive(self):
+        # A ZipFile must not be shared with forked worker processes
+        if self._zip is None or self._pid != os.getpid():
+            self._zip = zipfile.ZipFile(self.location)
+            self._pid = os.getpid()
+        return self._zip
+    
+    def identifiers(self):
+        """Yield the identifier of every email in the source"""
+        for info in self._archive().infolist():
+            if not info.is_dir() and info.filename.endswith('.eml'):
+                yield self.prefix + info.filename
+    
+    def read(self, ident):
+        """Return the raw bytes of an email"""
+        return self._archive().read(ident[len(self.prefix):])
+    
+    def stat(self, ident):
+        """Return (size, modification token) used to detect changed emails"""
+        info = self._archive().getinfo(ident[len(self.prefix):])
+        return info.file_size, '%04d%02d%02d%02d%02d%02d-%08x' % (info.date_time + (info.CRC,))
+
+
+class MboxSource:
+    """Messages of an mbox file, located through a memory-mapped scan
+    
+    Messages are separated by lines starting with "From "; each message is
+    identified by the byte offset of its separator line, which stays stable
+    while the mailbox is only appended to.
+    """
+    
+    def __init__(self, path):
+        self.location = str(path)
+        self.name = Path(path).name
+        self.prefix = self.name + MEMBER_SEPARATOR
+        self._map = None
+        self._pid = None
+    
+    def _mbox(self):
+        if self._map is None or self._pid != os.getpid():
+            with open(self.location, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._map = b''
+                else:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._pid = os.getpid()
+        return self._map
+    
+    def _message_end(self, data, offset):
+        end = data.find(b'\nFrom ', offset)
+        return len(data) if end == -1 else end + 1
+    
+    def identifiers(self):
+        """Yield the identifier of every email in the source"""
+        data = self._mbox()
+        offset = 0 if data[:5] == b'From ' else self._message_end(data, 0)
+        while offset < len(data):
+            yield self.prefix + str(offset)
+            offset = self._message_end(data, offset + 1)
+    
+    def read(self, ident):
+        """Return the raw bytes of an email (without the "From " separator line)"""
+        data = self._mbox()
+        offset = int(ident[len(self.prefix):])
+        if data[offset:offset + 5] != b'From ':
+            raise KeyError(f"No message at {ident}")
+        end = self._message_end(data, offset + 1)
+        start = data.find(b'\n', offset, end)
+        return data[start + 1:end] if start != -1 else b''
+    
+    def stat(self, ident):
+        """Return (size, modification token) used to detect changed emails
+        
+        Individual mbox messages have no mtime, so changes are always
+        confirmed through the content hash.
+        """
+        return len(self.read(ident)), None
+
+
+class MaildirSource:
+    """Messages in the cur/ and new/ folders of a Maildir
+    
+    Messages are identified by the unique part of their file name (before
+    the ":2,FLAGS" suffix), so marking a message as read or moving it from
+    new/ to cur/ does not change its identifier.
+    """
+    
+    def __init__(self, path):
+        self.location = str(path)
+        self.root = Path(path)
+        self.name = self.root.name
+        self.prefix = self.name + MEMBER_SEPARATOR
+        self._files = None
+    
+    def _scan(self):
+        files = {}
+        for subdir in ('new', 'cur'):
+            folder = self.root / subdir
+            if not folder.is_dir():
+                continue
+            for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    files[entry.name.split(':', 1)[0]] = entry.path
+        self._files = files
+        return files
+    
+    def _path(self, ident):
+        unique = ident[len(self.prefix):]
+        files = self._files if self._files is not None else self._scan()
+        if unique not in files or not os.path.exists(files[unique]):
+            files = self._scan()
+        if unique not in files:
+            raise FileNotFoundError(f"No message {ident} in {self.location}")
+        return files[unique]
+    
+    def identifiers(self):
+        """Yield the identifier of every email in the source"""
+        for unique in self._scan():
+            yield self.prefix + unique
+    
+    def read(self, ident):
+        """Return the raw bytes of an email"""
+        with open(self._path(ident), 'rb') as f:
+            return f.read()
+    
+    def stat(self, ident):
+        """Return (size, modification token) used to detect changed emails"""
+        st = os.stat(self._path(ident))
+        return st.st_size, st.st_mtime_ns
+
+
+class Prefetcher:
+    """Reads raw emails ahead of their consumer on a pool of threads
+    
+    For sources on slow or network-mounted storage: up to ``threads`` reads
+    are in flight while the consumer parses earlier emails. Read-ahead
+    pauses while ``max_ahead`` emails, or more than ``max_bytes`` of read but
+    not yet consumed data, are waiting, so memory use stays bounded. With
+    ``threads`` set to 0 nothing is read ahead.
+    """
+    
+    def __init__(self, source, threads=0, max_bytes=64 * 1024 * 1024, max_ahead=None):
+        self.source = source
+        self.threads = threads
+        self.max_bytes = max_bytes
+        self.max_ahead = max_ahead or max(1, threads) * 8
+    
+    def read(self, idents):
+        """Yield (identifier, raw bytes) in the order of ``idents``
+        
+        The raw bytes are None when nothing was read ahead or the read
+        failed; the consumer then reads the email itself (and sees the
+        error, if any).
+        """
+        if self.threads <= 0:
+            for ident in idents:
+                yield ident, None
+            return
+        
+        lock = threading.Lock()
+        buffered = [0]
+        
+        def read_one(ident):
+            try:
+                data = self.source.read(ident)
+            except Exception:
+                return None
+            with lock:
+                buffered[0] += len(data)
+            return data
+        
+        executor = ThreadPoolExecutor(self.threads)
+        pending = deque()
+        idents = iter(idents)
+        exhausted = False
+        try:
+            while True:
+                # Queue more reads unless enough data is already waiting
+                while not exhausted and len(pending) < self.max_ahead and buffered[0] < self.max_bytes:
+                    ident = next(idents, None)
+                    if ident is None:
+                        exhausted = True
+                        break
+                    pending.append((ident, executor.submit(read_one, ident)))
+                if not pending:
+                    return
+                ident, future = pending.popleft()
+                data = future.result()
+                if data is not None:
+                    with lock:
+                        buffered[0] -= len(data)
+                yield ident, data
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+def open_source(location, walk_threads=0):
+    """Return the mail source for a directory, Maildir, .zip archive or mbox file
+    
+    ``walk_threads`` enables parallel directory listing for a directory of
+    .eml files.
+    """
+    path = Path(location)
+    if path.is_dir():
+        if (path / 'cur').is_dir() and (path / 'new').is_dir():
+            return MaildirSource(path)
+        return DirectorySource(path, walk_threads)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    return MboxSource(path)
+
+
+def default_source(emails_dir='./relpies1114'):
+    """Return the default mail location: the extracted directory, else the zip archive"""
+    if not os.path.exists(emails_dir) and os.path.exists(emails_dir + '.zip'):
+        return emails_dir + '.zip'
+    return emails_dir
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics - Throughput, latency, error and memory metrics of the pipeline stages
+"""
+
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+# Per-item latencies are counted in logarithmic buckets (4 per doubling,
+# so a percentile is reported within 19% of the true value). Bucket
+# counters are plain Counters, so worker processes can send theirs back
+# to be added up like the other statistics.
+BUCKETS_PER_DOUBLING = 4
+MIN_LATENCY_BUCKET = -80  # about 1 microsecond
+
+# Percentiles reported for every stage
+PERCENTILES = (50, 90, 95, 99)
+
+
+def latency_bucket(seconds):
+    """Return the bucket a latency is counted in (see bucket_seconds)"""
+    if seconds <= 0:
+        return MIN_LATENCY_BUCKET
+    return max(MIN_LATENCY_BUCKET, math.ceil(math.log2(seconds) * BUCKETS_PER_DOUBLING))
+
+
+def bucket_seconds(bucket):
+    """Return the upper bound, in seconds, of the latencies counted in a bucket"""
+    return 2 ** (bucket / BUCKETS_PER_DOUBLING)
+
+
+def peak_rss_mb():
+    """Return the peak RSS of this process and of its finished children, in MB"""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def format_seconds(seconds):
+    """Return a duration as e.g. '45s', '12m05s' or '3h20m'"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Progress:
+    """Prints progress lines with the processing rate and an ETA
+    
+    update() is called once per item, so it only compares the count with
+    the next checkpoint (every ``every`` items); a line is printed at a
+    checkpoint if at least ``interval`` seconds passed since the last one.
+    """
+    
+    def __init__(self, label, every=100, interval=1.0):
+        self.label = label
+        self.every = every
+        self.interval = interval
+        self.next_count = every
+        self.started = time.perf_counter()
+        self.last = self.started
+    
+    def update(self, count, total=None, approximate=False):
+        """Report that ``count`` items are done (out of ``total``, if known)"""
+        if count < self.next_count:
+            return
+        self.next_count = count + self.every
+        now = time.perf_counter()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        
+        rate = count / (now - self.started)
+        done = f"{count}/{'~' if approximate else ''}{total}" if total else f"{count}"
+        line = f"Progress: {done} {self.label} ({rate:.0f}/s"
+        if total and total > count and rate > 0:
+            line += f", ETA {format_seconds((total - count) / rate)}"
+        print(line + ")...")
+
+
+class StageMetrics:
+    """Counters of one run of a pipeline stage
+    
+    ``items`` counts what the stage processed (emails or contacts),
+    ``errors`` the items that could not be read or parsed, ``latency``
+    the per-item processing times by latency_bucket and ``categories``
+    the items per email category.
+    """
+    
+    def __init__(self, stage, unit='emails'):
+        self.stage = stage
+        self.unit = unit
+        self.items = 0
+        self.errors = 0
+        self.latency = Counter()
+        self.categories = Counter()
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.seconds = None
+    
+    def observe(self, seconds):
+        """Count the processing time of one item"""
+        self.latency[latency_bucket(seconds)] += 1
+    
+    def finish(self):
+        """Stop the stage clock"""
+        self.seconds = time.perf_counter() - self._start
+        return self
+    
+    def percentile(self, percent):
+        """Return the latency (upper bucket bound, in seconds) below which ``percent``% of the items fall"""
+        observed = sum(self.latency.values())
+        if not observed:
+            return None
+        rank = math.ceil(observed * percent / 100)
+        seen = 0
+        for bucket in sorted(self.latency):
+            seen += self.latency[bucket]
+            if seen >= rank:
+                return bucket_seconds(bucket)
+        return None
+    
+    def to_dict(self):
+        """Return the metrics as a JSON-ready dict"""
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self._start
+        latency = {}
+        for percent in PERCENTILES:
+            value = self.percentile(percent)
+            latency[f'p{percent}'] = round(value, 6) if value is not None else None
+        return {
+            'stage': self.stage,
+            'unit': self.unit,
+            'started_at': round(self.started_at, 3),
+            'seconds': round(seconds, 3),
+            'items': self.items,
+            'items_per_second': round(self.items / seconds, 1) if seconds > 0 else None,
+            'errors': self.errors,
+            'latency_seconds': latency,
+            'categories': dict(sorted(self.categories.items())),
+        }
+
+
+class RunRecord:
+    """JSON record of the stages of a pipeline run, optionally mirrored in Prometheus format
+    
+    Each stage adds its metrics when it finishes (replacing an earlier
+    entry for the same stage), together with the peak memory use so far.
+    With ``prometheus_file`` the record is also written in the Prometheus
+    text exposition format, for node_exporter's textfile collector.
+    """
+    
+    def __init__(self, path, prometheus_file=None):
+        self.path = Path(path)
+        self.prometheus_file = Path(prometheus_file) if prometheus_file else None
+        self.data = {'started_at': round(time.time(), 3), 'stages': []}
+    
+    def load(self):
+        """Load the record written so far, if there is one"""
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        return self
+    
+    def add_stage(self, metrics):
+        """Add (or replace) the metrics of a stage"""
+        stage = metrics.to_dict()
+        self.data['stages'] = [s for s in self.data['stages'] if s['stage'] != stage['stage']]
+        self.data['stages'].append(stage)
+        return self
+    
+    def save(self):
+        """Write the record (and the Prometheus file), each replaced atomically"""
+        own, children = peak_rss_mb()
+        self.data['updated_at'] = round(time.time(), 3)
+        self.data['peak_rss_mb'] = {'self': own, 'children': children}
+        _write_atomic(self.path, json.dumps(self.data, indent=2) + '\n')
+        if self.prometheus_file:
+            _write_atomic(self.prometheus_file, self.prometheus_text())
+        print(f"Metrics saved to: {self.path}")
+    
+    def prometheus_text(self):
+        """Return the record in the Prometheus text exposition format"""
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP emailanalyzer_{name} {help_text}")
+            lines.append(f"# TYPE emailanalyzer_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ','.join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+                lines.append(f"emailanalyzer_{name}{{{label_text}}} {value}" if label_text
+                             else f"emailanalyzer_{name} {value}")
+        
+        stages = self.data['stages']
+        metric('stage_items', 'gauge', 'Items (emails or contacts) processed by the stage.',
+               [((('stage', s['stage']),), s['items']) for s in stages])
+        metric('stage_errors', 'gauge', 'Items the stage could not read or parse.',
+               [((('stage', s['stage']),), s['errors']) for s in stages])
+        metric('stage_duration_seconds', 'gauge', 'Wall-clock duration of the stage.',
+               [((('stage', s['stage']),), s['seconds']) for s in stages])
+        metric('stage_items_per_second', 'gauge', 'Stage throughput.',
+               [((('stage', s['stage']),), s['items_per_second']) for s in stages])
+        metric('stage_item_latency_seconds', 'gauge', 'Per-item processing time percentiles.',
+               [((('stage', s['stage']), ('quantile', f"{int(p[1:]) / 100:g}")), value)
+                for s in stages for p, value in s['latency_seconds'].items()])
+        metric('stage_category_items', 'gauge', 'Items per email category.',
+               [((('stage', s['stage']), ('category', category)), count)
+                for s in stages for category, count in s['categories'].items()])
+        metric('stage_started_timestamp_seconds', 'gauge', 'Unix time the stage started.',
+               [((('stage', s['stage']),), s['started_at']) for s in stages])
+        pipeline = self.data.get('pipeline')
+        if pipeline:
+            metric('pipeline_duration_seconds', 'gauge', 'Wall-clock duration of the whole pipeline run.',
+                   [((), pipeline['seconds'])])
+            metric('pipeline_steps_run', 'gauge', 'Pipeline steps that ran (1) or were up to date (0).',
+                   [((('step', step),), 1) for step in pipeline['steps_run']] +
+                   [((('step', step),), 0) for step in pipeline['steps_skipped']])
+        rss = self.data.get('peak_rss_mb', {})
+        metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the pipeline processes.',
+               [((('process', process),), int(mb * 1024 * 1024)) for process, mb in sorted(rss.items())
+                if mb is not None])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return re.sub(r'(["\\])', r'\\\1', str(value)).replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    tmp_path = str(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
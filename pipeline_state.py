@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Pipeline State - Runs pipeline steps only when their inputs, code or configuration changed
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from mail_sources import open_source
+
+
+# The pipeline scripts live next to this module
+CODE_DIR = Path(__file__).resolve().parent
+
+
+class Step:
+    """One step of the pipeline and everything that decides its outputs
+    
+    ``inputs`` and ``outputs`` are file paths (inputs produced by another
+    step make it run first), ``source`` is a mail source read by the step,
+    ``code`` lists the modules (relative to CODE_DIR) the step's results
+    depend on and ``config`` holds the options that change its outputs.
+    ``run`` is called without arguments to run the step.
+    """
+    
+    def __init__(self, name, title, run, inputs=(), outputs=(), source=None, code=(), config=None):
+        self.name = name
+        self.title = title
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.source = source
+        self.code = list(code)
+        self.config = config or {}
+
+
+class PipelineState:
+    """Fingerprints of the last successful run of each step
+    
+    A step's fingerprint combines the content hashes of its input files
+    and code, a listing of its mail source (identifier, size and
+    modification token of every email) and its configuration. Files whose
+    size and mtime are unchanged since they were last hashed are not read
+    again.
+    """
+    
+    def __init__(self, path='.pipeline_state.json'):
+        self.path = Path(path)
+        self.steps = {}
+        self.hashes = {}
+    
+    def load(self):
+        """Load the state of the previous run if there is one"""
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.steps = data.get('steps', {})
+            self.hashes = data.get('hashes', {})
+        return self
+    
+    def save(self):
+        """Write the state (after every completed step, so an interrupted run keeps it)"""
+        tmp_path = str(self.path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'steps': self.steps, 'hashes': self.hashes}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+    
+    def file_hash(self, path):
+        """Return the SHA-1 of a file, or None if it does not exist"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = str(path)
+        cached = self.hashes.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        self.hashes[key] = [st.st_size, st.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+    
+    def fingerprint(self, step):
+        """Return {component: digest} describing what the step's outputs depend on"""
+        fingerprint = {
+            'config': json.dumps(step.config, sort_keys=True),
+        }
+        for path in step.inputs:
+            fingerprint[f'input:{path}'] = self.file_hash(path)
+        for name in step.code:
+            fingerprint[f'code:{name}'] = self.file_hash(CODE_DIR / name)
+        if step.source:
+            fingerprint[f'source:{step.source}'] = source_fingerprint(step.source)
+        return fingerprint
+    
+    def out_of_date(self, step, fingerprint):
+        """Return why the step has to run, or None if its outputs are current"""
+        previous = self.steps.get(step.name)
+        if previous is None:
+            return 'never run'
+        for path in step.outputs:
+            if not os.path.exists(path):
+                return f'{path} is missing'
+        for component, digest in sorted(fingerprint.items()):
+            if previous.get(component) != digest:
+                return f'{component} changed'
+        for component in previous:
+            if component not in fingerprint:
+                return f'{component} removed'
+        return None
+    
+    def record(self, step, fingerprint):
+        """Remember a successful run of the step"""
+        self.steps[step.name] = fingerprint
+        self.save()
+
+
+def source_fingerprint(location):
+    """Return a digest of the identifiers, sizes and modification tokens of a mail source
+    
+    A .zip archive or mbox file is summarized by the stat of the file
+    itself; directories and Maildirs are listed (without reading any
+    email), which is far cheaper than categorizing them again.
+    """
+    digest = hashlib.sha1()
+    if os.path.isfile(location):
+        st = os.stat(location)
+        digest.update(f'{st.st_size}\0{st.st_mtime_ns}'.encode('utf-8'))
+        return digest.hexdigest()
+    source = open_source(location)
+    for ident in source.identifiers():
+        size, mtime = source.stat(ident)
+        digest.update(f'{ident}\0{size}\0{mtime}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def order_steps(steps):
+    """Return the steps in dependency order (declaration order among independent steps)"""
+    producers = {path: step.name for step in steps for path in step.outputs}
+    depends = {
+        step.name: {producers[path] for path in step.inputs
+                    if path in producers and producers[path] != step.name}
+        for step in steps
+    }
+    ordered = []
+    done = set()
+    while len(ordered) < len(steps):
+        ready = [step for step in steps if step.name not in done and depends[step.name] <= done]
+        if not ready:
+            raise ValueError('Pipeline steps have a dependency cycle')
+        ordered.append(ready[0])
+        done.add(ready[0].name)
+    return ordered
+
+
+def downstream(steps, name):
+    """Return the names of a step and of every step depending on it, directly or not"""
+    producers = {path: step.name for step in steps for path in step.outputs}
+    names = {name}
+    for step in order_steps(steps):
+        if any(producers.get(path) in names for path in step.inputs):
+            names.add(step.name)
+    return names
+
+
+def run_steps(steps, state, force=(), force_from=None):
+    """Run every out-of-date step in dependency order
+    
+    Steps named in ``force`` (or all steps, for 'all') always run, and so do
+    ``force_from`` and every step downstream of it. Other steps are checked
+    just before they would run, so a step whose inputs were rewritten
+    with identical contents by an earlier step is still skipped. Returns
+    the names of the steps that ran.
+    """
+    forced = set(force)
+    if 'all' in forced:
+        forced = {step.name for step in steps}
+    if force_from:
+        forced |= downstream(steps, force_from)
+    
+    ran = []
+    for step in order_steps(steps):
+        fingerprint = state.fingerprint(step)
+        reason = 'forced' if step.name in forced else state.out_of_date(step, fingerprint)
+        if reason is None:
+            print(f"\n✓ {step.title} is up to date, skipped")
+            continue
+        print(f"\n{step.title}: running ({reason})")
+        step.run()
+        for path in step.outputs:
+            if not os.path.exists(path):
+                raise RuntimeError(f"{step.title} did not write {path}")
+        state.record(step, fingerprint)
+        ran.append(step.name)
+    return ran
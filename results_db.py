@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Results Database - SQLite store for the outputs of every pipeline step
+"""
+
+import argparse
+import csv
+import json
+import sqlite3
+from email.utils import parseaddr
+
+from email_records import COMPREHENSIVE_CSV_COLUMNS, comprehensive_row
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    display_name TEXT,
+    position INTEGER
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    category TEXT,
+    sender TEXT,
+    sender_domain TEXT,
+    recipients TEXT,
+    subject TEXT,
+    date TEXT,
+    reply_to TEXT,
+    body TEXT,
+    has_record INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_category ON messages (category);
+CREATE INDEX IF NOT EXISTS messages_sender_domain ON messages (sender_domain);
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    primary_email TEXT,
+    domain TEXT,
+    category TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_primary_email ON contacts (primary_email);
+CREATE INDEX IF NOT EXISTS contacts_domain ON contacts (domain);
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    primary_email TEXT,
+    domain TEXT,
+    lead_score INTEGER,
+    name TEXT,
+    company TEXT,
+    response_type TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS leads_primary_email ON leads (primary_email);
+CREATE INDEX IF NOT EXISTS leads_lead_score ON leads (lead_score);
+CREATE INDEX IF NOT EXISTS leads_domain_score ON leads (domain, lead_score);
+'''
+
+
+def email_domain(address):
+    """Return the lowercased domain of an email address or From header ('' if none)"""
+    address = parseaddr(address or '')[1]
+    return address.rsplit('@', 1)[1].lower() if '@' in address else ''
+
+
+class ResultsDatabase:
+    """SQLite database with tables for messages, categories, contacts and leads
+    
+    Each pipeline step replaces its own tables: analyze_emails.py writes
+    messages and categories, extract_contact_info.py contacts and
+    enrich_contacts.py leads. Messages are inserted in transactions of
+    ``batch_size`` rows while they are categorized; contacts and leads are
+    replaced in a single transaction. watch_mailbox.py adds to the tables
+    instead, one email at a time. The flat CSV/JSON outputs can be
+    regenerated from the database with export_all().
+    """
+    
+    def __init__(self, path='results.db', batch_size=5000):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.conn = None
+        self._pending = []
+    
+    def connect(self):
+        """Open the database, creating the tables and indexes if needed"""
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.executescript(SCHEMA)
+        return self
+    
+    def close(self):
+        """Write any buffered rows and close the database"""
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+    
+    # Writing
+    
+    def start_messages(self, source, categories):
+        """Clear the messages of a previous analysis before adding new ones
+        
+        ``categories`` is the list of category names in output order.
+        """
+        self.connect()
+        with self.conn:
+            self.conn.execute('DELETE FROM messages')
+            self.conn.execute('DELETE FROM categories')
+            self.conn.executemany(
+                'INSERT INTO categories (name, display_name, position) VALUES (?, ?, ?)',
+                [(name, name.replace('_', ' ').title(), position)
+                 for position, name in enumerate(categories)])
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)",
+                              (str(source),))
+    
+    def add_message(self, rel_path, category, record=None):
+        """Buffer one categorized email (with its parsed record, if any)"""
+        record = record or {}
+        self._pending.append((
+            rel_path,
+            category,
+            record.get('from', ''),
+            email_domain(record.get('from', '')),
+            record.get('to', ''),
+            record.get('subject', ''),
+            record.get('date', ''),
+            record.get('reply_to', ''),
+            record.get('body', ''),
+            1 if record else 0,
+        ))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """Insert the buffered messages in a single transaction"""
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO messages (path, category, sender, sender_domain, '
+                'recipients, subject, date, reply_to, body, has_record) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self._pending)
+        self._pending = []
+    
+    def save_contacts(self, contacts):
+        """Replace the extracted contacts (kept in their output order)"""
+        self.connect()
+        rows = []
+        with self.conn:
+            self.conn.execute('DELETE FROM contacts')
+            for contact in contacts:
+                primary_email = contact['emails'][0] if contact['emails'] else ''
+                rows.append((primary_email, email_domain(primary_email), contact.get('category', ''),
+                             json.dumps(contact, ensure_ascii=False)))
+                if len(rows) >= self.batch_size:
+                    self._insert_contacts(rows)
+                    rows = []
+            self._insert_contacts(rows)
+        print(f"✓ Saved {len(contacts)} contacts to: {self.path}")
+    
+    def _insert_contacts(self, rows):
+        self.conn.executemany(
+            'INSERT INTO contacts (primary_email, domain, category, data) VALUES (?, ?, ?, ?)', rows)
+    
+    def save_leads(self, enriched_contacts):
+        """Replace the enriched contacts (kept in enrichment order)"""
+        self.connect()
+        rows = []
+        with self.conn:
+            self.conn.execute('DELETE FROM leads')
+            for contact in enriched_contacts:
+                rows.append((
+                    contact['emails'][0] if contact['emails'] else '',
+                    contact.get('domain', ''),
+                    contact.get('lead_score', 0),
+                    contact.get('enriched_name', ''),
+                    contact.get('company_enriched', ''),
+                    contact.get('response_type', ''),
+                    json.dumps(contact, ensure_ascii=False),
+                ))
+                if len(rows) >= self.batch_size:
+                    self._insert_leads(rows)
+                    rows = []
+            self._insert_leads(rows)
+        print(f"✓ Saved {len(enriched_contacts)} enriched contacts to: {self.path}")
+    
+    def add_contact(self, contact, merge):
+        """Add one contact, merged into the stored contact with the same primary email
+        
+        ``merge(existing, contact)`` combines the two (see
+        ContactInfoExtractor.merge_contact). Returns the stored contact.
+        """
+        self.connect()
+        primary_email = contact['emails'][0] if contact['emails'] else ''
+        row = self.conn.execute('SELECT id, data FROM contacts WHERE primary_email = ? ORDER BY id LIMIT 1',
+                                (primary_email,)).fetchone()
+        with self.conn:
+            if row is None:
+                self._insert_contacts([(primary_email, email_domain(primary_email),
+                                        contact.get('category', ''),
+                                        json.dumps(contact, ensure_ascii=False))])
+                return contact
+            contact = merge(json.loads(row[1]), contact)
+            self.conn.execute('UPDATE contacts SET data = ? WHERE id = ?',
+                              (json.dumps(contact, ensure_ascii=False), row[0]))
+        return contact
+    
+    def replace_lead(self, enriched_contact):
+        """Store one enriched contact in place of the lead with the same primary email"""
+        self.connect()
+        primary_email = enriched_contact['emails'][0] if enriched_contact['emails'] else ''
+        with self.conn:
+            self.conn.execute('DELETE FROM leads WHERE primary_email = ?', (primary_email,))
+            self._insert_leads([(
+                primary_email,
+                enriched_contact.get('domain', ''),
+                enriched_contact.get('lead_score', 0),
+                enriched_contact.get('enriched_name', ''),
+                enriched_contact.get('company_enriched', ''),
+                enriched_contact.get('response_type', ''),
+                json.dumps(enriched_contact, ensure_ascii=False),
+            )])
+    
+    def _insert_leads(self, rows):
+        self.conn.executemany(
+            'INSERT INTO leads (primary_email, domain, lead_score, name, company, response_type, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    
+    # Reading
+    
+    def source(self):
+        """Return the mail source the messages were read from"""
+        row = self.connect().conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row[0] if row else None
+    
+    def categories(self):
+        """Return {category: [email paths in discovery order]}, like categories.json"""
+        self.connect()
+        categories = {name: [] for name, in
+                      self.conn.execute('SELECT name FROM categories ORDER BY position')}
+        for path, category in self.conn.execute('SELECT path, category FROM messages ORDER BY seq'):
+            categories.setdefault(category, []).append(path)
+        return categories
+    
+    def messages(self, category=None, sender_domain=None):
+        """Yield the records of the stored messages, optionally filtered"""
+        query = ('SELECT path, category, sender, recipients, subject, date, reply_to, body '
+                 'FROM messages WHERE has_record')
+        params = []
+        if category is not None:
+            query += ' AND category = ?'
+            params.append(category)
+        if sender_domain is not None:
+            query += ' AND sender_domain = ?'
+            params.append(sender_domain.lower())
+        for row in self.connect().conn.execute(query + ' ORDER BY seq', params):
+            yield dict(zip(('path', 'category', 'from', 'to', 'subject', 'date', 'reply_to', 'body'), row))
+    
+    def contacts(self, domain=None):
+        """Return the extracted contacts, optionally only those at a domain"""
+        query = 'SELECT data FROM contacts'
+        params = []
+        if domain is not None:
+            query += ' WHERE domain = ?'
+            params.append(domain.lower())
+        return [json.loads(data) for data, in
+                self.connect().conn.execute(query + ' ORDER BY id', params)]
+    
+    def leads(self, min_score=None, domain=None):
+        """Return enriched contacts, best lead score first, optionally filtered
+        
+        For example leads(min_score=70, domain='acme.com') returns the
+        high-quality leads at acme.com using the (domain, lead_score) index.
+        """
+        query = 'SELECT data FROM leads'
+        conditions = []
+        params = []
+        if domain is not None:
+            conditions.append('domain = ?')
+            params.append(domain.lower())
+        if min_score is not None:
+            conditions.append('lead_score >= ?')
+            params.append(min_score)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        return [json.loads(data) for data, in
+                self.connect().conn.execute(query + ' ORDER BY lead_score DESC, id', params)]
+    
+    # Exports
+    
+    def export_categories_json(self, output_file='categories.json'):
+        """Write categories.json from the database"""
+        with open(output_file, 'w') as f:
+            json.dump(self.categories(), f, indent=2)
+        print(f"Categories saved to: {output_file}")
+    
+    def export_categories_csv(self, output_file='email_categories.csv'):
+        """Write email_categories.csv from the database"""
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Email Filename', 'Category', 'Category Name'])
+            for category, emails in sorted(self.categories().items()):
+                category_name = category.replace('_', ' ').title()
+                for email_file in sorted(emails):
+                    writer.writerow([email_file, category, category_name])
+        print(f"Categories CSV saved to: {output_file}")
+    
+    def export_comprehensive_csv(self, output_file='comprehensive_email_details.csv'):
+        """Write comprehensive_email_details.csv from the database"""
+        rows = self.connect().conn.execute(
+            'SELECT path, category, sender, recipients, subject, date, body FROM messages '
+            'WHERE has_record ORDER BY category, path')
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(COMPREHENSIVE_CSV_COLUMNS)
+            for path, category, sender, recipients, subject, date, body in rows:
+                record = {'from': sender, 'to': recipients, 'subject': subject,
+                          'date': date, 'body': body}
+                writer.writerow(comprehensive_row(path, category, category.replace('_', ' ').title(),
+                                                  record))
+        print(f"✓ Comprehensive email details saved to: {output_file}")
+    
+    def export_all(self, output_dir='.'):
+        """Regenerate the CSV/JSON outputs of every step that wrote to the database"""
+        # Imported here: the step modules import this one to write results
+        from extract_contact_info import ContactInfoExtractor
+        from enrich_contacts import ContactEnricher
+        from pathlib import Path
+        
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self.connect()
+        
+        if self.conn.execute('SELECT 1 FROM categories LIMIT 1').fetchone():
+            self.export_categories_json(output_dir / 'categories.json')
+            self.export_categories_csv(output_dir / 'email_categories.csv')
+            self.export_comprehensive_csv(output_dir / 'comprehensive_email_details.csv')
+        
+        if self.conn.execute('SELECT 1 FROM contacts LIMIT 1').fetchone():
+            extractor = ContactInfoExtractor(None, categories_file=None)
+            extractor.contacts = self.contacts()
+            extractor.save_to_csv(output_dir / 'extracted_contacts.csv')
+            extractor.save_to_json(output_dir / 'extracted_contacts.json')
+        
+        if self.conn.execute('SELECT 1 FROM leads LIMIT 1').fetchone():
+            enricher = ContactEnricher(contacts_file=None)
+            enricher.enriched_contacts = [json.loads(data) for data, in
+                                          self.conn.execute('SELECT data FROM leads ORDER BY id')]
+            enricher.save_to_csv(output_dir / 'enriched_contacts.csv')
+            enricher.save_to_json(output_dir / 'enriched_contacts.json')
+            enricher.export_high_quality_leads(output_dir / 'high_quality_leads.csv', min_score=70)
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Query or export the pipeline results database')
+    parser.add_argument('database', nargs='?', default='results.db',
+                        help='results database written with --db (default: results.db)')
+    parser.add_argument('--export', metavar='DIR',
+                        help='regenerate the CSV/JSON output files in DIR')
+    parser.add_argument('--leads', action='store_true',
+                        help='print enriched leads (best first) as JSON Lines')
+    parser.add_argument('--domain', help='only leads at this email domain')
+    parser.add_argument('--min-score', type=int, help='only leads with at least this lead score')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = ResultsDatabase(args.database).connect()
+    
+    if args.export:
+        db.export_all(args.export)
+    if args.leads:
+        for lead in db.leads(min_score=args.min_score, domain=args.domain):
+            print(json.dumps(lead, ensure_ascii=False))
+    
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
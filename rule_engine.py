@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Rule Engine - Compiles declarative substring rules into one matcher per field
+"""
+
+import re
+import time
+
+
+# How each rule field is read from the message text:
+# field -> (text source, window). A window of None means anywhere in the
+# text, 'start' means at offset 0 and an integer N means fully inside the
+# first N characters.
+FIELD_SOURCES = {
+    'subject': ('subject', None),
+    'subject_start': ('subject', 'start'),
+    'from': ('from', None),
+    'body': ('body', None),
+    'body_head': ('body_head', None),
+    'body_500': ('body_head', 500),
+}
+
+# Text sources read from the message body; all other sources come from headers
+BODY_SOURCES = {'body', 'body_head'}
+
+# Fields compared for equality with the whole (lowercased) header value
+EQUALITY_FIELDS = {
+    'auto_submitted': ('auto_submitted', False),
+    'not_auto_submitted': ('auto_submitted', True),
+}
+
+# Fields looked up in a set of names: 'has_header' holds when any of the
+# (lowercased) header names is present in the message
+PRESENCE_FIELDS = {
+    'has_header': 'header_names',
+}
+
+
+class PatternMatcher:
+    """Finds every pattern occurring in a text with a single regex scan"""
+    
+    def __init__(self, patterns):
+        # Longest first, so at each offset the alternation reports the longest
+        # pattern starting there; any shorter pattern starting at the same
+        # offset is a prefix of it and is recorded through self.implied.
+        self.patterns = sorted(set(patterns), key=lambda p: (-len(p), p))
+        alternation = '|'.join(re.escape(p) for p in self.patterns)
+        self.regex = re.compile(f'(?=({alternation}))')
+        self.implied = {
+            p: [q for q in self.patterns if p.startswith(q)]
+            for p in self.patterns
+        }
+    
+    def scan(self, text):
+        """Return {pattern: offset of first occurrence} for every pattern in text"""
+        found = {}
+        if not self.patterns:
+            return found
+        for match in self.regex.finditer(text):
+            start = match.start()
+            for pattern in self.implied[match.group(1)]:
+                if pattern not in found:
+                    found[pattern] = start
+        return found
+
+
+class RuleEngine:
+    """Evaluates a declarative rule table with one scan per text field
+    
+    ``rules`` is a list of (category, alternatives) in precedence order. A
+    category matches when any alternative matches; an alternative is a list
+    of (field, patterns) conditions that must all hold, and a condition holds
+    when any of its patterns occurs in the field (see FIELD_SOURCES,
+    EQUALITY_FIELDS and PRESENCE_FIELDS). All patterns read from the same text source are
+    compiled into a single PatternMatcher, so each source is scanned at most
+    once per message, and only when a rule actually needs it.
+    """
+    
+    def __init__(self, rules, default='other'):
+        self.default = default
+        source_patterns = {}
+        self.rules = []
+        for category, alternatives in rules:
+            compiled_alternatives = []
+            for conditions in alternatives:
+                compiled_conditions = []
+                for field, patterns in conditions:
+                    if field in EQUALITY_FIELDS:
+                        source, negate = EQUALITY_FIELDS[field]
+                        compiled_conditions.append((source, None, frozenset(patterns), negate, field))
+                        continue
+                    if field in PRESENCE_FIELDS:
+                        compiled_conditions.append((PRESENCE_FIELDS[field], 'set', frozenset(patterns), None, field))
+                        continue
+                    source, window = FIELD_SOURCES[field]
+                    source_patterns.setdefault(source, set()).update(patterns)
+                    compiled_conditions.append((source, window, frozenset(patterns), None, field))
+                compiled_alternatives.append(compiled_conditions)
+            self.rules.append((category, compiled_alternatives))
+        # Patterns of the equality and presence conditions, by source
+        self.value_patterns = {}
+        for category, alternatives in self.rules:
+            for conditions in alternatives:
+                for source, window, patterns, negate, field in conditions:
+                    if negate is not None or window == 'set':
+                        self.value_patterns.setdefault(source, set()).update(patterns)
+        self.matchers = {
+            source: PatternMatcher(patterns)
+            for source, patterns in source_patterns.items()
+        }
+    
+    def categorize(self, get_field, stats=None, scans=None):
+        """Return the first category whose rules match
+        
+        ``get_field(source)`` returns the lowercased text of a source; it is
+        called lazily, at most once per source. When a ``stats`` Counter is
+        given, rule counters are added to it (see _categorize_instrumented).
+        ``scans`` may hold pattern scans already made by header_signature.
+        """
+        if scans is None:
+            scans = {}
+        
+        def condition_holds(source, window, patterns, negate, field):
+            if negate is not None:
+                return (get_field(source) in patterns) != negate
+            if window == 'set':
+                return not patterns.isdisjoint(get_field(source))
+            found = scans.get(source)
+            if found is None:
+                found = scans[source] = self.matchers[source].scan(get_field(source))
+            if window is None:
+                return not patterns.isdisjoint(found)
+            for pattern in patterns.intersection(found):
+                start = found[pattern]
+                if window == 'start':
+                    if start == 0:
+                        return True
+                elif start + len(pattern) <= window:
+                    return True
+            return False
+        
+        if stats is not None:
+            return self._categorize_instrumented(condition_holds, scans, get_field, stats)
+        
+        for category, alternatives in self.rules:
+            for conditions in alternatives:
+                if all(condition_holds(*condition) for condition in conditions):
+                    return category
+        return self.default
+    
+    def header_signature(self, get_field, scans=None):
+        """Return a summary of everything the rules can see outside the body
+        
+        Two emails with the same signature (and the same body) get the same
+        category: it holds the patterns found in each header source (and
+        whether they are at its start) plus the matching header values and
+        names of the equality and presence conditions. Sorted tuples keep
+        it stable across processes and runs. The pattern scans are stored
+        in ``scans`` for a following categorize() call.
+        """
+        if scans is None:
+            scans = {}
+        signature = []
+        for source in sorted(self.matchers):
+            if source in BODY_SOURCES:
+                continue
+            found = scans[source] = self.matchers[source].scan(get_field(source))
+            signature.append((source, tuple(sorted((p, start == 0) for p, start in found.items()))))
+        for source in sorted(self.value_patterns):
+            value = get_field(source)
+            if isinstance(value, str):
+                matched = [value] if value in self.value_patterns[source] else []
+            else:
+                matched = self.value_patterns[source].intersection(value)
+            signature.append((source, tuple(sorted(matched))))
+        return tuple(signature)
+    
+    def _categorize_instrumented(self, condition_holds, scans, get_field, stats):
+        """Categorize like categorize() while counting, for every category rule:
+        
+        - ('reached', category): messages that got as far as the rule
+        - ('hit', category): messages the rule decided
+        - ('seconds', category): time spent evaluating the rule, including
+          reading (and decoding) the fields it is the first to need
+        - ('pattern', category, 'field:pattern'): hits per pattern of the
+          alternative that decided the message
+        """
+        for category, alternatives in self.rules:
+            stats[('reached', category)] += 1
+            start = time.perf_counter()
+            matched = None
+            for conditions in alternatives:
+                if all(condition_holds(*condition) for condition in conditions):
+                    matched = conditions
+                    break
+            stats[('seconds', category)] += time.perf_counter() - start
+            if matched is not None:
+                stats[('hit', category)] += 1
+                for source, window, patterns, negate, field in matched:
+                    for pattern in self._hit_patterns(scans, get_field, source, window, patterns, negate):
+                        stats[('pattern', category, f'{field}:{pattern}')] += 1
+                return category
+        stats[('reached', self.default)] += 1
+        stats[('hit', self.default)] += 1
+        return self.default
+    
+    def _hit_patterns(self, scans, get_field, source, window, patterns, negate):
+        """Return the patterns that made a holding condition true"""
+        if negate:
+            # A negated condition holds because none of its patterns matched
+            return sorted(patterns)
+        if negate is not None:
+            return [get_field(source)]
+        if window == 'set':
+            return sorted(patterns.intersection(get_field(source)))
+        found = scans[source]
+        hits = []
+        for pattern in sorted(patterns.intersection(found)):
+            start = found[pattern]
+            if (window is None or (window == 'start' and start == 0) or
+                    (window != 'start' and start + len(pattern) <= window)):
+                hits.append(pattern)
+        return hits
+    
+    def rule_report(self, stats):
+        """Turn the counters of _categorize_instrumented into a JSON-ready report
+        
+        Categories are listed in precedence order with every pattern of
+        their rules, so patterns that never decided a message show up with
+        a count of 0.
+        """
+        categories = []
+        for category, alternatives in self.rules:
+            patterns = {}
+            for conditions in alternatives:
+                for source, window, condition_patterns, negate, field in conditions:
+                    for pattern in sorted(condition_patterns):
+                        key = f'{field}:{pattern}'
+                        patterns[key] = stats[('pattern', category, key)]
+            categories.append({
+                'category': category,
+                'reached': stats[('reached', category)],
+                'hits': stats[('hit', category)],
+                'seconds': round(stats[('seconds', category)], 6),
+                'patterns': patterns,
+            })
+        categories.append({
+            'category': self.default,
+            'reached': stats[('reached', self.default)],
+            'hits': stats[('hit', self.default)],
+            'seconds': 0.0,
+            'patterns': {},
+        })
+        return {
+            'messages': stats[('reached', self.rules[0][0])] if self.rules else 0,
+            'seconds': round(sum(c['seconds'] for c in categories), 6),
+            'categories': categories,
+        }
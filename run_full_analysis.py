@@ -10,9 +10,25 @@ Runs all analysis steps in sequence:
 import os
 import sys
 import time
+import argparse
 
+from mail_sources import default_source
+from pipeline_metrics import RunRecord
+from pipeline_state import PipelineState, Step, run_steps
 
-def run_step(step_name, script_name):
+
+# Pipeline steps, in order; --force and --from take these names
+STEP_NAMES = ['categorize', 'extract', 'enrich']
+
+# Modules whose code decides the results of each step
+CATEGORIZE_CODE = ['analyze_emails.py', 'rule_engine.py', 'email_records.py', 'html_text.py',
+                   'mail_sources.py', 'email_manifest.py', 'classification_cache.py', 'results_db.py']
+EXTRACT_CODE = ['extract_contact_info.py', 'contact_scanner.py', 'email_records.py', 'html_text.py',
+                'mail_sources.py', 'results_db.py']
+ENRICH_CODE = ['enrich_contacts.py', 'results_db.py']
+
+
+def run_step(step_name, script_name, argv=None):
     """Run a single step of the pipeline"""
     print("\n" + "=" * 80)
     print(f"STEP: {step_name}")
@@ -23,19 +39,153 @@ def run_step(step_name, script_name):
     # Import and run the script
     if script_name == 'analyze_emails':
         import analyze_emails
-        analyze_emails.main()
+        analyze_emails.main(argv or [])
     elif script_name == 'extract_contact_info':
         import extract_contact_info
-        extract_contact_info.main()
+        extract_contact_info.main(argv or [])
     elif script_name == 'enrich_contacts':
         import enrich_contacts
-        enrich_contacts.main()
+        enrich_contacts.main(argv or [])
     
     elapsed = time.time() - start_time
     print(f"\n✓ {step_name} completed in {elapsed:.1f} seconds")
 
 
-def main():
+def run_fused(analyze_args, source, extract_workers=1, db=None, metrics=None, metrics_prom=None):
+    """Run categorization and contact extraction as one step whose stages overlap
+    
+    Categorized email records go straight from the analyzer to contact
+    extraction worker processes (see ContactExtractionStream) instead of
+    through categories.json and email_records.jsonl. Deduplication and the
+    sorted exports need every contact, so they run once the last email has
+    been categorized, and write the same files as the staged pipeline.
+    """
+    import analyze_emails
+    from extract_contact_info import ContactExtractionStream, ContactInfoExtractor, save_results
+    
+    print("\n" + "=" * 80)
+    print("STEP: 1+2. Email Categorization with Contact Extraction (fused)")
+    print("=" * 80 + "\n")
+    
+    start_time = time.time()
+    extractor = ContactInfoExtractor(source, categories_file=None)
+    consumer = ContactExtractionStream(extractor, workers=extract_workers)
+    analyze_emails.main(analyze_args, consumer=consumer)
+    save_results(extractor, db, metrics, metrics_prom)
+    elapsed = time.time() - start_time
+    print(f"\n✓ Categorization and contact extraction completed in {elapsed:.1f} seconds")
+
+
+def build_steps(args, source):
+    """Return the pipeline steps with their inputs, outputs, code and configuration
+    
+    Only options that change the output files go into a step's
+    configuration: --workers, --prefetch or --incremental don't make a step
+    run again.
+    """
+    step_args = ['--db', args.db] if args.db else []
+    if args.metrics:
+        # Each step adds its metrics to the run record
+        step_args += ['--metrics', args.metrics]
+        if args.metrics_prom:
+            step_args += ['--metrics-prom', args.metrics_prom]
+    db_outputs = [args.db] if args.db else []
+    
+    analyze_args = ['--source', source, '--workers', str(args.workers),
+                    '--prefetch', str(args.prefetch)]
+    if args.incremental:
+        analyze_args.append('--incremental')
+    if args.stream:
+        analyze_args.append('--stream')
+    if args.rule_stats:
+        analyze_args.append('--rule-stats')
+    analyze_args += step_args
+    
+    categories_file = 'categories.jsonl' if args.stream else 'categories.json'
+    categorize_outputs = [categories_file, 'email_categories.csv', 'comprehensive_email_details.csv',
+                          'analysis_report.txt', 'email_records.jsonl']
+    if args.rule_stats:
+        categorize_outputs.append('rule_stats.json')
+    extract_outputs = ['extracted_contacts.csv', 'extracted_contacts.json']
+    
+    enrich = Step('enrich', "3. Contact Database Enrichment",
+                  lambda: run_step("3. Contact Database Enrichment", "enrich_contacts", step_args),
+                  inputs=['extracted_contacts.json'],
+                  outputs=['enriched_contacts.csv', 'enriched_contacts.json',
+                           'high_quality_leads.csv'] + db_outputs,
+                  code=ENRICH_CODE, config={'db': args.db})
+    
+    if args.fused:
+        # Steps 1-2 with contact extraction overlapping categorization
+        fused = Step('categorize', "1+2. Email Categorization with Contact Extraction",
+                     lambda: run_fused(analyze_args, source, args.extract_workers, args.db,
+                                       args.metrics, args.metrics_prom),
+                     outputs=categorize_outputs + extract_outputs + db_outputs, source=source,
+                     code=sorted(set(CATEGORIZE_CODE + EXTRACT_CODE)),
+                     config={'stream': args.stream, 'rule_stats': args.rule_stats, 'db': args.db})
+        return [fused, enrich]
+    
+    return [
+        Step('categorize', "1. Email Categorization",
+             lambda: run_step("1. Email Categorization", "analyze_emails", analyze_args),
+             outputs=categorize_outputs + db_outputs, source=source, code=CATEGORIZE_CODE,
+             config={'stream': args.stream, 'rule_stats': args.rule_stats, 'db': args.db}),
+        Step('extract', "2. Contact Information Extraction",
+             lambda: run_step("2. Contact Information Extraction", "extract_contact_info",
+                              ['--source', source, '--prefetch', str(args.prefetch),
+                               '--workers', str(args.extract_workers)] + step_args),
+             inputs=[categories_file, 'email_records.jsonl'],
+             outputs=extract_outputs + db_outputs, code=EXTRACT_CODE, config={'db': args.db}),
+        enrich,
+    ]
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Run the full email analysis pipeline')
+    parser.add_argument('--source',
+                        help='emails to analyze: a directory of .eml files, a .zip archive, '
+                             'an mbox file or a Maildir (default: ./relpies1114, or '
+                             './relpies1114.zip if the directory does not exist)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes used for email categorization (default: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only categorize emails that are new or changed since the last incremental run')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream categorization results to disk instead of keeping them in memory')
+    parser.add_argument('--rule-stats', action='store_true',
+                        help='record per-rule hit counts and timings in rule_stats.json')
+    parser.add_argument('--db',
+                        help='also write all results to this SQLite database (e.g. results.db)')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='threads reading emails ahead of the parser, for slow or '
+                             'network-mounted storage (default: 0, no read-ahead)')
+    parser.add_argument('--fused', action='store_true',
+                        help='extract contacts while the emails are still being categorized '
+                             'instead of running the steps one after another')
+    parser.add_argument('--extract-workers', type=int, default=1,
+                        help='number of worker processes used for contact extraction '
+                             '(default: 1)')
+    parser.add_argument('--metrics',
+                        help='write throughput, latency, error, memory and per-category metrics '
+                             'of every step to this JSON run record (e.g. metrics.json)')
+    parser.add_argument('--metrics-prom',
+                        help='with --metrics, also write the metrics in Prometheus text format '
+                             '(e.g. for the node_exporter textfile collector)')
+    parser.add_argument('--force', action='append', default=[], choices=STEP_NAMES + ['all'],
+                        help='run this step even if it is up to date (may be repeated; '
+                             '"all" runs every step)')
+    parser.add_argument('--from', dest='from_step', choices=STEP_NAMES,
+                        help='rebuild from this step onward: run it and every step after it')
+    parser.add_argument('--state', default='.pipeline_state.json',
+                        help='file remembering what each step was last run with '
+                             '(default: .pipeline_state.json)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
     print("=" * 80)
     print("FULL EMAIL ANALYSIS PIPELINE")
     print("=" * 80)
@@ -45,24 +195,44 @@ def main():
     print("3. Enrich the contact database with additional data")
     print("\n" + "=" * 80 + "\n")
     
-    # Check if emails directory exists
-    if not os.path.exists('./relpies1114'):
+    # Check if the emails exist (the zip archive is read directly if it
+    # has not been extracted)
+    source = args.source or default_source('./relpies1114')
+    if not os.path.exists(source):
         print("Error: relpies1114 directory not found!")
-        print("Please extract the relpies1114.zip file first.")
+        print("Please download relpies1114.zip (or pass --source).")
         return 1
     
     total_start = time.time()
+    if args.metrics and os.path.exists(args.metrics):
+        # Every run starts a new run record
+        os.remove(args.metrics)
     
     try:
-        # Step 1: Categorize emails
-        run_step("1. Email Categorization", "analyze_emails")
-        
-        # Step 2: Extract contact info
-        run_step("2. Contact Information Extraction", "extract_contact_info")
-        
-        # Step 3: Enrich contacts
-        run_step("3. Contact Database Enrichment", "enrich_contacts")
-        
+        # Steps whose inputs, code and options are unchanged since their
+        # last run are skipped
+        steps = build_steps(args, source)
+        force = args.force
+        from_step = args.from_step
+        if args.fused:
+            # Extraction is part of the categorization step
+            force = ['categorize' if name == 'extract' else name for name in force]
+            if from_step == 'extract':
+                from_step = 'categorize'
+        state = PipelineState(args.state).load()
+        ran = run_steps(steps, state, force=force, force_from=from_step)
+        if not ran:
+            print("\nAll outputs are up to date; nothing to do (use --force or --from to re-run steps)")
+        if args.metrics:
+            record = RunRecord(args.metrics, args.metrics_prom).load()
+            record.data['started_at'] = round(total_start, 3)
+            record.data['pipeline'] = {
+                'seconds': round(time.time() - total_start, 3),
+                'steps_run': ran,
+                'steps_skipped': [step.name for step in steps if step.name not in ran],
+            }
+            record.save()
+    
     except Exception as e:
         print(f"\n✗ Pipeline failed with error: {e}")
         import traceback
@@ -81,7 +251,10 @@ def main():
     print("  3. high_quality_leads.csv - Best quality leads with To/Body")
     print("  4. extracted_contacts.csv - Raw extracted contacts with To/Body")
     print("  5. analysis_report.txt - Detailed email categorization")
-    print("  6. categories.json - Email categories in JSON format")
+    if args.stream:
+        print("  6. categories.jsonl - Email categories in JSON Lines format")
+    else:
+        print("  6. categories.json - Email categories in JSON format")
     print("\n✓ All analysis complete! Check the files above for results.")
     print("\n📥 Main file: comprehensive_email_details.csv contains ALL email data in ONE file!")
     
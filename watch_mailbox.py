@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Mailbox Watcher - Categorizes new emails and updates the contact database as they arrive
+"""
+
+import argparse
+import ctypes
+import os
+import select
+import signal
+import struct
+import time
+from datetime import datetime
+
+from analyze_emails import CategoryStream, EmailAnalyzer
+from enrich_contacts import ContactEnricher
+from extract_contact_info import TARGET_CATEGORIES, ContactInfoExtractor
+from email_records import source_key
+from mail_sources import DirectorySource, default_source
+
+
+# inotify event flags (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event without its variable-length name
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Reports .eml files written or moved into a directory tree, using Linux inotify
+    
+    The C library is called through ctypes, so no extra package is needed;
+    on systems without inotify the constructor raises OSError and the
+    caller falls back to PollingWatcher. A file is reported when it is
+    closed after writing or moved into the tree (as mail delivery agents
+    do), so it is complete by then. New subdirectories are watched as they
+    appear.
+    """
+    
+    def __init__(self, root):
+        self.root = str(root)
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Watch descriptor -> directory prefix of its identifiers
+        self.prefixes = {}
+        self._watch_tree('')
+    
+    def _watch_tree(self, prefix):
+        """Watch a directory and its subdirectories; return the .eml files already in them"""
+        found = []
+        pending = [prefix]
+        while pending:
+            prefix = pending.pop()
+            path = os.path.join(self.root, prefix)
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                continue
+            self.prefixes[wd] = prefix
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(prefix + entry.name + os.sep)
+                        elif entry.name.endswith('.eml'):
+                            found.append(prefix + entry.name)
+            except OSError:
+                continue
+        return found
+    
+    def poll(self, timeout):
+        """Wait up to ``timeout`` seconds and return the identifiers of new or rewritten emails
+        
+        Returns None when events were lost (the kernel queue overflowed),
+        in which case the whole tree has to be checked again.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        found = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                prefix = self.prefixes.get(wd)
+                if prefix is None:
+                    continue
+                if mask & IN_ISDIR:
+                    # Files may land in a new directory before it is watched
+                    found.extend(self._watch_tree(prefix + name + os.sep))
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and name.endswith('.eml'):
+                    found.append(prefix + name)
+        return found
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Reports new or changed .eml files by listing the directory tree periodically
+    
+    A file is reported once its size and mtime are the same in two
+    consecutive listings, so emails still being written are not read.
+    Listing a large tree is far slower than inotify; this is the fallback
+    for systems and file systems (e.g. network mounts) without it.
+    """
+    
+    def __init__(self, root):
+        self.source = DirectorySource(root)
+        self.reported = self._listing()
+        self.last = dict(self.reported)
+    
+    def _listing(self):
+        listing = {}
+        for ident in self.source.identifiers():
+            try:
+                listing[ident] = self.source.stat(ident)
+            except OSError:
+                continue
+        return listing
+    
+    def poll(self, timeout):
+        """Wait ``timeout`` seconds and return the identifiers of new or rewritten emails"""
+        time.sleep(timeout)
+        listing = self._listing()
+        found = []
+        for ident, stat in listing.items():
+            if self.last.get(ident) == stat and self.reported.get(ident) != stat:
+                self.reported[ident] = stat
+                found.append(ident)
+        self.last = listing
+        return found
+    
+    def close(self):
+        pass
+
+
+class MailboxWatcher:
+    """Long-running categorization and contact extraction of a mail directory
+    
+    Emails that are not yet in the manifest (or changed since) are
+    processed when the watcher starts, then every new email as soon as
+    the watcher reports it. One EmailAnalyzer, ContactInfoExtractor and
+    ContactEnricher are kept for the whole run, so compiled rules and the
+    classification cache stay warm. Each email is appended to the
+    streamed category files, the record store and the results database;
+    contacts are merged into the database's contacts by primary email and
+    their lead is enriched again.
+    """
+    
+    def __init__(self, emails_dir, db='results.db', manifest='email_manifest.json',
+                 records='email_records.jsonl', interval=0.5, polling=False, new_only=False,
+                 cache_size=0, manifest_save_seconds=30):
+        stream = CategoryStream('email_categories.csv', 'categories.jsonl',
+                                details_file='comprehensive_email_details.csv')
+        self.analyzer = EmailAnalyzer(emails_dir, record_store=records, manifest=manifest,
+                                      stream=stream, results_db=db, cache_size=cache_size)
+        self.extractor = ContactInfoExtractor(emails_dir, categories_file=None)
+        self.enricher = ContactEnricher(contacts_file=None)
+        self.source = self.analyzer.source
+        self.interval = interval
+        self.polling = polling
+        self.new_only = new_only
+        self.manifest_save_seconds = manifest_save_seconds
+        self.watcher = None
+        # With new_only: (size, mtime) of the existing emails that are left alone
+        self.ignored = {}
+        self._manifest_saved = time.time()
+        self.processed = 0
+        self.contacts = 0
+    
+    def open(self):
+        """Start watching and open the outputs for appending"""
+        if not isinstance(self.source, DirectorySource):
+            raise ValueError(f"Only directories of .eml files can be watched: {self.source.location}")
+        # Messages and contacts of two mailboxes must not end up in one database
+        db_source = self.analyzer.results_db.source()
+        if db_source is not None and source_key(db_source) != source_key(self.source.location):
+            raise ValueError(f"{self.analyzer.results_db.path} holds the emails of {db_source}, "
+                             f"not {self.source.location}; use another --db")
+        # Watch before looking at the existing files, so nothing that lands
+        # in between is missed (files reported twice are skipped through
+        # the manifest)
+        if not self.polling:
+            try:
+                self.watcher = InotifyWatcher(self.source.location)
+            except OSError:
+                print("inotify is not available; polling the directory instead")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(self.source.location)
+        
+        analyzer = self.analyzer
+        analyzer.record_store.open_for_writing(append=True, source=self.source.location)
+        analyzer.stream.open(append=True)
+        if analyzer.results_db.source() is None:
+            analyzer.results_db.start_messages(self.source.location, list(analyzer.categories))
+        self._manifest_saved = time.time()
+    
+    def close(self):
+        """Stop watching and save everything"""
+        analyzer = self.analyzer
+        if self.watcher is not None:
+            self.watcher.close()
+        analyzer.results_db.close()
+        analyzer.stream.close()
+        analyzer.record_store.close()
+        analyzer.manifest.save()
+        analyzer._compact_records()
+        if analyzer.cache is not None:
+            analyzer.cache.save()
+        print(f"Processed {self.processed} emails; updated {self.contacts} contacts")
+    
+    def run(self, once=False):
+        """Process the emails not seen before, then (unless ``once``) keep watching"""
+        self.open()
+        try:
+            backlog = self.changed(self.source.identifiers())
+            if self.new_only:
+                # Leave the existing emails alone unless they change
+                self.ignored = {ident: self.source.stat(ident) for ident in backlog}
+                backlog = []
+            print(f"{len(backlog)} emails to process before watching")
+            self.process(backlog)
+            if once:
+                return
+            
+            print(f"Watching {self.source.location} for new emails (Ctrl+C to stop)...")
+            while True:
+                found = self.watcher.poll(self.interval)
+                if found is None:
+                    print("Missed file events; checking the whole directory again")
+                    found = self.source.identifiers()
+                self.process(self.changed(found))
+                if time.time() - self._manifest_saved >= self.manifest_save_seconds:
+                    self.analyzer.manifest.save()
+                    self._manifest_saved = time.time()
+        except KeyboardInterrupt:
+            print("\nStopping...")
+        finally:
+            self.close()
+    
+    def changed(self, idents):
+        """Return the identifiers whose email is not in the manifest or changed since"""
+        pending = []
+        for ident in dict.fromkeys(idents):
+            try:
+                if ident in self.ignored and self.source.stat(ident) == self.ignored[ident]:
+                    continue
+                if self.analyzer.manifest.lookup(ident, self.source) is None:
+                    pending.append(ident)
+            except OSError:
+                # Deleted (or moved away) since it was reported
+                continue
+        return pending
+    
+    def process(self, idents):
+        """Categorize emails, append them to the outputs and update their contacts"""
+        if not idents:
+            return
+        analyzer = self.analyzer
+        for rel_path, category, record, digest in analyzer._categorize_serial(idents):
+            if record is not None:
+                analyzer.record_store.append(record)
+            if digest is not None:
+                analyzer.manifest.update(rel_path, digest, category)
+            analyzer.results_db.add_message(rel_path, category, record)
+            analyzer.stream.add(rel_path, category, record)
+            self.processed += 1
+            
+            note = ''
+            if record is not None and category in TARGET_CATEGORIES:
+                contact = self.extractor.extract_contact_from_record(record, category)
+                if contact and contact['emails']:
+                    contact = analyzer.results_db.add_contact(contact, self.extractor.merge_contact)
+                    lead = self.enricher.enrich_contact(contact)
+                    analyzer.results_db.replace_lead(lead)
+                    self.contacts += 1
+                    note = f" -> {contact['emails'][0]} (lead score {lead['lead_score']})"
+            print(f"[{datetime.now():%H:%M:%S}] {rel_path}: {category}{note}")
+        
+        analyzer.results_db.flush()
+        analyzer.stream.flush()
+        analyzer.record_store.flush()
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(
+        description='Categorize new emails and update the contact database as they arrive')
+    parser.add_argument('--source',
+                        help='directory of .eml files to watch (default: ./relpies1114)')
+    parser.add_argument('--db', default='results.db',
+                        help='SQLite results database that gets every email, contact and lead '
+                             '(default: results.db)')
+    parser.add_argument('--manifest', default='email_manifest.json',
+                        help='manifest of the emails already processed, shared with '
+                             'analyze_emails.py --incremental (default: email_manifest.json)')
+    parser.add_argument('--records', default='email_records.jsonl',
+                        help='parsed email record store to append to (default: email_records.jsonl)')
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between checks for new emails (default: 0.5)')
+    parser.add_argument('--poll', action='store_true',
+                        help='list the directory at every check instead of using inotify')
+    parser.add_argument('--new-only', action='store_true',
+                        help='skip the emails already in the directory that are not in the manifest')
+    parser.add_argument('--once', action='store_true',
+                        help='process the emails not seen before and exit instead of watching')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='reuse categories of repeated and near-identical emails, keeping up '
+                             'to this many signatures (default: 0, no cache)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    emails_dir = args.source or default_source('./relpies1114')
+    if not os.path.isdir(emails_dir):
+        print(f"Error: Directory '{emails_dir}' not found!")
+        return
+    
+    # Stop cleanly (saving the manifest and closing the outputs) when a
+    # service manager sends SIGTERM
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    
+    watcher = MailboxWatcher(emails_dir, db=args.db, manifest=args.manifest, records=args.records,
+                             interval=args.interval, polling=args.poll, new_only=args.new_only,
+                             cache_size=args.cache_size)
+    try:
+        watcher.run(once=args.once)
+    except ValueError as e:
+        print(f"Error: {e}")
+
+
+if __name__ == '__main__':
+    main()